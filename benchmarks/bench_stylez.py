@@ -0,0 +1,304 @@
+"""
+Headless benchmark for the Stylez backend
+
+Generates synthetic style libraries in a temporary extension directory,
+loads scripts/Stylez.py against stubbed `modules` and `gradio` packages and
+times the scan, render, search, favourite and CSV import paths, reporting
+wall time and tracemalloc peak memory for each as JSON.
+
+    python benchmarks/bench_stylez.py --sizes 1000 10000 --categories 20
+    python benchmarks/bench_stylez.py --sizes 100000 --no-previews --output bench.json
+
+fastapi, pydantic and Pillow are used when installed and replaced by
+minimal stand-ins otherwise, none of the timed paths decode images.
+"""
+import argparse
+import atexit
+import csv
+import importlib.util
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+stylez_script = os.path.join(repo_root, "scripts", "Stylez.py")
+
+words = (
+    "cinematic photo portrait landscape watercolor oil painting anime manga gothic baroque neon cyberpunk "
+    "steampunk minimalist vintage film grain bokeh dramatic lighting soft pastel vibrant colors detailed "
+    "illustration concept art isometric low poly pixel art sketch charcoal ink wash ukiyo-e art nouveau "
+    "surreal dreamy ethereal moody dark fantasy sci-fi futuristic retro synthwave chibi cute realistic"
+).split()
+negatives = [
+    "lowres, bad anatomy, bad hands, text, error, missing fingers, cropped, worst quality, low quality",
+    "ugly, deformed, noisy, blurry, distorted, grainy",
+    "anime, cartoon, graphic, text, painting, crayon, graphite, abstract, glitch, deformed, mutated, ugly, disfigured",
+    "",
+]
+
+
+def install_stubs(extension_dir):
+    """register stand-ins for the WebUI modules and gradio, plus optional third party packages"""
+    modules = types.ModuleType("modules")
+    modules.__path__ = []
+
+    scripts = types.ModuleType("modules.scripts")
+    scripts.basedir = lambda: extension_dir
+    scripts.AlwaysVisible = object()
+    scripts.Script = type("Script", (), {})
+
+    shared = types.ModuleType("modules.shared")
+    shared.cmd_opts = types.SimpleNamespace(styles_file=[])
+    shared.state = types.SimpleNamespace(interrupted=False, job_count=0)
+
+    script_callbacks = types.ModuleType("modules.script_callbacks")
+    for name in ("on_ui_tabs", "on_app_started"):
+        setattr(script_callbacks, name, lambda *args, **kwargs: None)
+
+    processing = types.ModuleType("modules.processing")
+    processing.process_images = lambda p: None
+    processing.get_fixed_seed = lambda seed: seed
+    processing.Processed = type("Processed", (), {})
+
+    call_queue = types.ModuleType("modules.call_queue")
+    call_queue.wrap_gradio_gpu_call = lambda fn, *args, **kwargs: fn
+
+    paste = types.ModuleType("modules.generation_parameters_copypaste")
+
+    for module in (scripts, shared, script_callbacks, processing, call_queue, paste):
+        setattr(modules, module.__name__.rsplit(".", 1)[1], module)
+        sys.modules[module.__name__] = module
+    sys.modules["modules"] = modules
+
+    gradio = types.ModuleType("gradio")
+    gradio.update = lambda **kwargs: kwargs
+    gradio.Info = gradio.Warning = lambda message: None
+    gradio.Request = type("Request", (), {})
+    sys.modules["gradio"] = gradio
+
+    try:
+        import fastapi  # noqa: F401
+        import fastapi.responses  # noqa: F401
+    except ImportError:
+        fastapi = types.ModuleType("fastapi")
+        for name in ("FastAPI", "Request", "Response"):
+            setattr(fastapi, name, type(name, (), {}))
+        fastapi.HTTPException = type("HTTPException", (Exception,), {})
+        fastapi.Depends = lambda dependency=None: dependency
+        responses = types.ModuleType("fastapi.responses")
+        responses.FileResponse = type("FileResponse", (), {})
+        security = types.ModuleType("fastapi.security")
+        security.HTTPBasic = lambda: None
+        security.HTTPBasicCredentials = type("HTTPBasicCredentials", (), {})
+        fastapi.responses, fastapi.security = responses, security
+        sys.modules["fastapi"] = fastapi
+        sys.modules["fastapi.responses"] = responses
+        sys.modules["fastapi.security"] = security
+    try:
+        import pydantic  # noqa: F401
+    except ImportError:
+        pydantic = types.ModuleType("pydantic")
+        pydantic.BaseModel = type("BaseModel", (), {})
+        sys.modules["pydantic"] = pydantic
+    try:
+        import PIL.Image  # noqa: F401
+    except ImportError:
+        pil = types.ModuleType("PIL")
+        pil.__path__ = []
+        pil.Image = types.ModuleType("PIL.Image")
+        pil.features = types.ModuleType("PIL.features")
+        pil.features.check = lambda feature: False
+        sys.modules["PIL"] = pil
+        sys.modules["PIL.Image"] = pil.Image
+        sys.modules["PIL.features"] = pil.features
+
+
+def load_stylez(extension_dir):
+    install_stubs(extension_dir)
+    spec = importlib.util.spec_from_file_location("Stylez", stylez_script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # keep the thumbnail builder out of the measurements
+    module.thumbnail_cache.submit = lambda *args, **kwargs: None
+    return module
+
+
+def generate_library(extension_dir, styles, categories, previews, seed=0):
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(extension_dir, "scripts"), exist_ok=True)
+    shutil.copy(os.path.join(repo_root, "nopreview.jpg"), os.path.join(extension_dir, "nopreview.jpg"))
+    with open(os.path.join(repo_root, "nopreview.jpg"), "rb") as f:
+        preview_bytes = f.read()
+    styles_dir = os.path.join(extension_dir, "styles")
+    for index in range(styles):
+        category = f"Category {index % categories:03d}"
+        name = f"{rng.choice(words)} {rng.choice(words)} {index}"
+        folder = os.path.join(styles_dir, category)
+        os.makedirs(folder, exist_ok=True)
+        style = {
+            "name": name,
+            "description": " ".join(rng.choices(words, k=4)),
+            "preview": f"{name}.jpg",
+            "prompt": ", ".join(rng.choices(words, k=rng.randint(8, 40))) + (", {prompt}" if index % 3 == 0 else ""),
+            "negative": rng.choice(negatives),
+        }
+        with open(os.path.join(folder, f"{name}.json"), "w", encoding="utf-8") as f:
+            json.dump(style, f, indent=4)
+        if previews:
+            with open(os.path.join(folder, f"{name}.jpg"), "wb") as f:
+                f.write(preview_bytes)
+    return styles_dir
+
+
+def generate_csv(path, rows, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "prompt", "negative_prompt"])
+        for index in range(rows):
+            writer.writerow([f"csv style {index}", ", ".join(rng.choices(words, k=12)), rng.choice(negatives)])
+
+
+def measure(fn, repeat=1, setup=None):
+    """
+    return ({seconds (median), peak_mb}, result of the first run)
+    timings come from untraced runs, peak memory from one extra run under
+    tracemalloc, setup is called before every run to restore the starting state
+    """
+    timings = []
+    result = None
+    for run in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        value = fn()
+        timings.append(time.perf_counter() - start)
+        if run == 0:
+            result = value
+    if setup:
+        setup()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": round(statistics.median(timings), 6), "peak_mb": round(peak / 2 ** 20, 3)}, result
+
+
+def touch_styles(styles_dir, fraction, seed=1):
+    rng = random.Random(seed)
+    paths = [os.path.join(root, name) for root, _, files in os.walk(styles_dir) for name in files if name.endswith(".json")]
+    for path in rng.sample(paths, max(1, int(len(paths) * fraction))):
+        with open(path, "r", encoding="utf-8") as f:
+            style = json.load(f)
+        style["description"] += " (edited)"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(style, f, indent=4)
+
+
+def card_payload_bytes(stylez, size=120):
+    total_bytes, page = 0, 0
+    while True:
+        result = stylez.list_cards("All", "", page, size)
+        total_bytes += len(json.dumps(result, ensure_ascii=False).encode("utf-8"))
+        page += 1
+        if page * size >= result["total"]:
+            return total_bytes, page
+
+
+def bench_library(styles, categories, previews, csv_rows):
+    extension_dir = tempfile.mkdtemp(prefix="stylez-bench-")
+    stylez = None
+    try:
+        start = time.perf_counter()
+        styles_dir = generate_library(extension_dir, styles, categories, previews)
+        result = {
+            "styles": styles,
+            "categories": categories,
+            "previews": previews,
+            "generate_library_seconds": round(time.perf_counter() - start, 3),
+        }
+        stylez = load_stylez(extension_dir)
+
+        def cold_catalog():
+            stylez.style_catalog = stylez.StyleCatalog(styles_dir)
+            stylez.search_index = stylez.StyleSearchIndex()
+            if os.path.exists(stylez.catalog_snapshot_json):
+                os.remove(stylez.catalog_snapshot_json)
+        result["generate_html_code_cold"], (html, _, _) = measure(stylez.generate_html_code, setup=cold_catalog)
+        result["generate_html_code_warm"], _ = measure(stylez.generate_html_code, repeat=3)
+        result["refresh_styles_warm"], _ = measure(lambda: stylez.refresh_styles("All"), repeat=3)
+        result["html_payload_bytes"] = len(html.encode("utf-8"))
+        result["refresh_styles_1pct_changed"], _ = measure(lambda: stylez.refresh_styles("All"), setup=lambda: touch_styles(styles_dir, 0.01))
+
+        def startup_from_snapshot():
+            catalog = stylez.StyleCatalog(styles_dir)
+            catalog.load_snapshot(stylez.catalog_snapshot_json)
+            return catalog.rescan(trust_dirs=True)
+        result["startup_from_snapshot"], _ = measure(startup_from_snapshot, repeat=3)
+
+        result["list_cards_first_page"], _ = measure(lambda: stylez.list_cards("All", "", 0, 120), repeat=5)
+        result["card_payload"], (payload_bytes, pages) = measure(lambda: card_payload_bytes(stylez))
+        result["card_payload"].update({"bytes": payload_bytes, "pages": pages})
+
+        search_timings = {}
+        for query in ("cinematic portrait", "gothc", "water color", "synthwave neon 12"):
+            search_timings[query], _ = measure(lambda: stylez.search_styles(query, "All", 120), repeat=5)
+        result["search"] = search_timings
+
+        style_ids = [style["id"] for style in stylez.style_catalog.entries()[:200]]
+
+        # the favourite buttons' handlers, the write behind them is one flush at the end
+        def toggle_favourites():
+            for style_id in style_ids:
+                stylez.addToFavourite(style_id, None)
+                stylez.removeFavourite(style_id, None)
+            stylez.settings.flush()
+        result["favourite_add_remove_x200_then_flush"], _ = measure(toggle_favourites)
+
+        csv_path = os.path.join(extension_dir, "styles.csv")
+        generate_csv(csv_path, csv_rows)
+        conversion_dir = os.path.join(styles_dir, "CSVConversion")
+        convert = lambda: stylez.save_json_objects(stylez.create_json_objects_from_csv(csv_path))
+        result["csv_import"], report = measure(convert, setup=lambda: shutil.rmtree(conversion_dir, ignore_errors=True))
+        result["csv_import"]["rows"] = report["rows"]
+        result["csv_reimport_unchanged"], _ = measure(convert)
+        return result
+    finally:
+        if stylez is not None:
+            atexit.unregister(stylez.settings.flush)
+            atexit.unregister(stylez.style_usage.flush)
+            stylez.settings.flush()
+        shutil.rmtree(extension_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="library sizes to generate")
+    parser.add_argument("--categories", type=int, default=20, help="number of category folders")
+    parser.add_argument("--no-previews", action="store_true", help="generate styles without preview images")
+    parser.add_argument("--csv-rows", type=int, default=None, help="rows in the generated styles.csv (default: library size)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "results": [bench_library(size, args.categories, not args.no_previews, args.csv_rows or size) for size in args.sizes],
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
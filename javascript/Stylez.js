@@ -134,32 +134,52 @@ function checkElement() {
         gradioApp().getElementById('style_delete_btn').addEventListener('click', () => {
             deleteRefresh();
         });
+        new MutationObserver(stylezGridInit).observe(gradioApp().getElementById('style_cards_column'), {childList: true, subtree: true});
+        stylezGridInit();
+        stylezResolutionPanelInit();
     } else {
         setTimeout(checkElement, 100);
     }
 }
 checkElement();
 
-// 添加选中框
+// 添加选中框，勾选的卡片是批量操作的对象
 function toggleCardSelection(event, folder, filename) {
-    const card = event.target.closest('.style_card');
-    const checkbox = card.querySelector('.style_card_checkbox');
+    const checkbox = event.target.closest('.style_card_checkbox');
+    const id = event.target.closest('.style_card').dataset.id;
     checkbox.classList.toggle('checked');
-    card.classList.toggle('selected');
+    if (checkbox.classList.contains('checked')) {
+        stylezBulkSelected.add(id);
+    } else {
+        stylezBulkSelected.delete(id);
+    }
     // 阻止传播以防点击事件传播到卡片本身
     event.stopPropagation();
 }
 
+// marks the card of an applied style, separate from the bulk selection
+function stylezToggleSelected(card) {
+    card.classList.toggle('selected');
+    if (card.classList.contains('selected')) {
+        stylezSelected.add(card.dataset.id);
+    } else {
+        stylezSelected.delete(card.dataset.id);
+    }
+}
+
 //apply styles
-function applyStyle(prompt, negative,origin) {
+function applyStyle(prompt, negative,origin,cardElement) {
     const applyStylePrompt = gradioApp().querySelector('#styles_apply_prompt > label > input');
     const applyStyleNeg = gradioApp().querySelector('#styles_apply_neg > label > input');
     //positive checks
     orgPrompt = promptPos.value;
     orgNegative = promptNeg.value;
-    if (origin == "Stylez") {
-        prompt = removeFirstAndLastCharacter(prompt)
-        negative = removeFirstAndLastCharacter(negative)
+    if (origin == "Stylez" || origin == "Catalog") {
+        // "Stylez" prompts come json quoted from inline handlers, "Catalog" ones are raw
+        if (origin == "Stylez") {
+            prompt = removeFirstAndLastCharacter(prompt)
+            negative = removeFirstAndLastCharacter(negative)
+        }
         if(prompt.includes("{prompt}")) {
             const promptPossections = prompt.split("{prompt}");
             const promptPossectionA = promptPossections[0].trim();
@@ -238,9 +258,11 @@ function applyStyle(prompt, negative,origin) {
     }
     
     // 应用选中框
-    const card = event.target.closest('.style_card');
+    const card = cardElement || event.target.closest('.style_card');
     // 点击卡片时切换选择
-    toggleCardSelection(event, card.getAttribute('data-foldername'), card.getAttribute('data-filename'));
+    if (card) {
+        stylezToggleSelected(card);
+    }
 }
 
 function hoverPreviewStyle(prompt,negative,origin) {
@@ -252,7 +274,7 @@ function hoverPreviewStyle(prompt,negative,origin) {
         if (origin == "Stylez") {
             prompt = removeFirstAndLastCharacter(prompt)
             negative = removeFirstAndLastCharacter(negative)
-        } else {
+        } else if (origin != "Catalog") {
             prompt = decodeURIComponent(prompt).replaceAll(/%27/g, "'")
             negative = decodeURIComponent(negative).replaceAll(/%27/g, "'")
         }
@@ -311,89 +333,464 @@ function removeFirstAndLastCharacter(inputString) {
     }
 }
 
+function hideDuplicatesChange() {
+    if (stylezGrid.element) {
+        stylezGridReload();
+    }
+}
+
 function cardSizeChange(value) {
-    const styleCards = gradioApp().querySelectorAll('.style_card');
-    styleCards.forEach((card) => {
-        card.style.minHeight = value + 'px';
-        card.style.maxHeight = value + 'px';
-        card.style.minWidth = value + 'px';
-        card.style.maxWidth = value + 'px';
-    });
+    stylezGrid.cardSize = parseInt(value);
+    stylezGrid.elements = new Map();
+    stylezGridRender();
 }
 
-function filterSearch(cat, search) {
-    let searchString = search.toLowerCase();
-    const styleCards = gradioApp().querySelectorAll('.style_card');
-    if (searchString == "") {
-        if (cat == "All") {
-            styleCards.forEach(card => {
-                card.style.display = "flex";
-            });
-        } else if (cat == "Favourites") {
-            styleCards.forEach(card => {
-                var btn = card.querySelector(".favouriteStyleBtn");
-                let computedelem = getComputedStyle(btn);
-                if (computedelem.color === "rgb(255, 255, 255)") {
-                    card.style.display = "none";
-                } else {
-                    card.style.display = "flex";
-                }
-            });
-        } else {
-            styleCards.forEach(card => {
-                const cardCategory = card.getAttribute('data-category');
-                if (cardCategory == cat) {
-                    card.style.display = "flex";
-                } else {
-                    card.style.display = "none";
-                }
-            });
+// order dropdown labels to the order names /stylez/cards understands
+const stylezOrders = {'默认排序': 'default', '常用优先': 'usage', '最近使用': 'recent'};
+let stylezSearchTimer = null;
+function filterSearch(cat, search, order) {
+    clearTimeout(stylezSearchTimer);
+    stylezSearchTimer = setTimeout(() => {
+        stylezGrid.category = cat;
+        stylezGrid.query = search;
+        stylezGrid.order = stylezOrders[order] || stylezGrid.order;
+        if (stylezGrid.element) {
+            stylezGridReload();
         }
-    } else {
-        if (cat == "All") {
-            styleCards.forEach(card => {
-                const cardTitle = card.getAttribute('data-title');
-                if (cardTitle.includes(searchString)) {
-                    card.style.display = "flex";
-                } else {
-                    card.style.display = "none";
-                }
-            });
-        } else if (cat == "Favourites") {
-            styleCards.forEach(card => {
-                const cardTitle = card.getAttribute('data-title');
-                var btn = card.querySelector(".favouriteStyleBtn");
-                let computedelem = getComputedStyle(btn);
-                if (cardTitle.includes(searchString)) {
-                    if (computedelem.color === "rgb(255, 255, 255)") {
-                        card.style.display = "none";
+    }, 150);
+}
+
+// virtualized card grid: only the rows around the viewport exist in the DOM,
+// card data is fetched page by page from /stylez/cards
+const stylezPageSize = 120;
+let stylezSelected = new Set();
+// ticked checkboxes, what the bulk row acts on; applying a style never adds to it
+let stylezBulkSelected = new Set();
+// prompt texts by key, cards only carry the keys and every page brings the
+// texts its cards use once, however many cards share them
+let stylezPrompts = new Map();
+let stylezGrid = {
+    element: null,
+    windowElement: null,
+    scroller: null,
+    category: "All",
+    query: "",
+    order: "default",
+    cardSize: 108,
+    total: 0,
+    version: 0,
+    categories: null,
+    pages: new Map(),
+    stale: new Map(),
+    pending: new Set(),
+    elements: new Map(),
+    cards: new Map(),
+    hovered: null,
+    generation: 0,
+    frame: null,
+};
+
+function stylezGridInit() {
+    const grid = gradioApp().getElementById('style_cards_grid');
+    if (!grid || grid === stylezGrid.element) {
+        return;
+    }
+    stylezGrid.element = grid;
+    // one set of listeners for every card, the cards themselves carry no handlers
+    grid.addEventListener('click', stylezGridClick);
+    grid.addEventListener('mouseover', stylezGridHover);
+    grid.addEventListener('mouseout', stylezGridHoverOut);
+    stylezGrid.cardSize = parseInt(grid.dataset.cardSize) || stylezGrid.cardSize;
+    stylezGrid.order = grid.dataset.order || stylezGrid.order;
+    stylezGrid.categories = grid.dataset.categories !== undefined ? grid.dataset.categories : null;
+    stylezGrid.windowElement = document.createElement('div');
+    stylezGrid.windowElement.className = 'style_cards_window';
+    grid.appendChild(stylezGrid.windowElement);
+    const scroller = gradioApp().getElementById('style_cards_column');
+    if (scroller !== stylezGrid.scroller) {
+        stylezGrid.scroller = scroller;
+        scroller.addEventListener('scroll', stylezGridSchedule, {passive: true});
+        new ResizeObserver(stylezGridSchedule).observe(scroller);
+    }
+    if (grid.dataset.loading) {
+        stylezGridSkeleton();
+        return;
+    }
+    stylezGridReload();
+}
+
+// the catalog is still being built in the background: show placeholder cards
+// and a progress line, then load the cards once /stylez/status says ready.
+// the gradio refresh (a full rescan) only runs when the dropdowns are stale
+function stylezGridSkeleton() {
+    const grid = stylezGrid.element;
+    const progress = document.createElement('div');
+    progress.className = 'style_cards_loading';
+    progress.textContent = '正在加载风格库…';
+    grid.insertBefore(progress, stylezGrid.windowElement);
+    const fragment = document.createDocumentFragment();
+    for (let index = 0; index < 24; index++) {
+        fragment.appendChild(stylezCardPlaceholder());
+    }
+    stylezGrid.windowElement.replaceChildren(fragment);
+    const poll = () => {
+        if (grid !== stylezGrid.element || !grid.isConnected) {
+            return;
+        }
+        fetch('stylez/status')
+            .then(response => response.json())
+            .then(status => {
+                if (status.ready) {
+                    progress.remove();
+                    delete grid.dataset.loading;
+                    if (status.categories.join('\n') !== stylezGrid.categories) {
+                        gradioApp().querySelector('#style_refresh').click();
                     } else {
-                        card.style.display = "flex";
+                        stylezGridReload();
                     }
-                } else {
-                    card.style.display = "none";
+                    return;
+                }
+                const counts = status.total ? ` ${status.done}/${status.total}` : '';
+                progress.textContent = `正在加载风格库… ${status.stage}${counts}`;
+                setTimeout(poll, 500);
+            })
+            .catch(() => setTimeout(poll, 2000));
+    };
+    poll();
+}
+
+function stylezGridReload() {
+    stylezGrid.generation += 1;
+    stylezGrid.total = 0;
+    stylezGrid.pages = new Map();
+    stylezGrid.stale = new Map();
+    stylezGrid.pending = new Set();
+    stylezGrid.elements = new Map();
+    stylezGrid.cards = new Map();
+    stylezGrid.scroller.scrollTop = 0;
+    stylezGridFetch(0);
+}
+
+// refetch page data after cards were added or removed, the old pages keep
+// being shown until the new ones arrive and unchanged cards keep their nodes
+function stylezGridRefetch() {
+    stylezGrid.generation += 1;
+    stylezGrid.stale = stylezGrid.pages;
+    stylezGrid.pages = new Map();
+    stylezGrid.pending = new Set();
+    stylezGridRender();
+}
+
+function stylezGridFetch(page) {
+    if (stylezGrid.pages.has(page) || stylezGrid.pending.has(page)) {
+        return;
+    }
+    const generation = stylezGrid.generation;
+    stylezGrid.pending.add(page);
+    const params = new URLSearchParams({category: stylezGrid.category, q: stylezGrid.query, order: stylezGrid.order, page: page, size: stylezPageSize});
+    fetch(`stylez/cards?${params}`)
+        .then(response => response.json())
+        .then(data => {
+            if (generation !== stylezGrid.generation) {
+                return;
+            }
+            stylezGrid.pending.delete(page);
+            stylezGrid.total = data.total;
+            stylezGrid.version = Math.max(stylezGrid.version, data.version);
+            stylezAddPrompts(data.prompts);
+            data.cards.forEach(card => stylezGrid.cards.set(card.id, card));
+            stylezGrid.pages.set(page, data.cards);
+            stylezGrid.stale.delete(page);
+            stylezGridRender();
+        })
+        .catch(error => {
+            stylezGrid.pending.delete(page);
+            console.error("Stylez: failed to load cards", error);
+        });
+}
+
+function stylezGridSchedule() {
+    if (stylezGrid.frame === null) {
+        stylezGrid.frame = requestAnimationFrame(() => {
+            stylezGrid.frame = null;
+            stylezGridRender();
+        });
+    }
+}
+
+function stylezGridCard(index) {
+    const pageIndex = Math.floor(index / stylezPageSize);
+    const page = stylezGrid.pages.get(pageIndex) || stylezGrid.stale.get(pageIndex);
+    return page ? page[index % stylezPageSize] : undefined;
+}
+
+function stylezGridUpdateCard(id, fields) {
+    [stylezGrid.pages, stylezGrid.stale].forEach(pages => {
+        pages.forEach(cards => {
+            cards.forEach(card => {
+                if (card.id === id) {
+                    Object.assign(card, fields);
                 }
             });
-        } else {
-            styleCards.forEach(card => {
-                const cardTitle = card.getAttribute('data-title');
-                const cardCategory = card.getAttribute('data-category');
-                if (cardTitle.includes(searchString) && cardCategory == cat) {
-                    card.style.display = "flex";
+        });
+    });
+}
+
+// apply the catalog changes made since the last seen version, only the
+// affected cards are rebuilt
+function stylezPollChanges() {
+    if (!stylezGrid.element || !stylezGrid.version) {
+        return;
+    }
+    fetch(`stylez/changes?since=${stylezGrid.version}`)
+        .then(response => response.json())
+        .then(data => {
+            const categories = data.categories.join('\n');
+            if (stylezGrid.categories !== null && stylezGrid.categories !== categories) {
+                // a folder was added or removed, let gradio refresh the dropdowns
+                gradioApp().querySelector('#style_refresh').click();
+            }
+            stylezGrid.categories = categories;
+            if (data.version === stylezGrid.version) {
+                return;
+            }
+            stylezGrid.version = data.version;
+            if (data.reset) {
+                stylezGridReload();
+                return;
+            }
+            stylezAddPrompts(data.prompts);
+            let refetch = false;
+            data.changes.forEach(change => {
+                stylezGrid.elements.delete(change.id);
+                if (change.op === 'update') {
+                    stylezGridUpdateCard(change.id, change.card);
                 } else {
-                    card.style.display = "none";
+                    refetch = true;
                 }
             });
+            if (refetch) {
+                stylezGridRefetch();
+            } else {
+                stylezGridRender();
+            }
+        })
+        .catch(error => console.error("Stylez: failed to poll changes", error));
+}
+
+function stylezAddPrompts(prompts) {
+    if (stylezPrompts.size > 50000) {
+        stylezPrompts = new Map();
+    }
+    Object.entries(prompts || {}).forEach(([key, text]) => stylezPrompts.set(key, text));
+}
+
+// call back with the card's prompt texts, straight away when they are known so
+// the handlers still run inside the click, otherwise after fetching them by key
+function stylezWithPrompts(card, callback) {
+    const keys = [card.prompt_key, card.negative_key];
+    const missing = keys.filter(key => !stylezPrompts.has(key));
+    if (missing.length === 0) {
+        callback(stylezPrompts.get(keys[0]), stylezPrompts.get(keys[1]));
+        return;
+    }
+    fetch(`stylez/prompts?ids=${encodeURIComponent(missing.join(','))}`)
+        .then(response => response.json())
+        .then(prompts => {
+            stylezAddPrompts(prompts);
+            callback(stylezPrompts.get(keys[0]) || "", stylezPrompts.get(keys[1]) || "");
+        })
+        .catch(error => console.error("Stylez: failed to load prompts", error));
+}
+
+function stylezGridTarget(event) {
+    const element = event.target.closest('.style_card');
+    const card = element && stylezGrid.cards.get(element.dataset.id);
+    return card ? {element: element, card: card} : null;
+}
+
+function stylezGridClick(event) {
+    const target = stylezGridTarget(event);
+    if (!target) {
+        return;
+    }
+    const {element, card} = target;
+    const encodedFilename = encodeURIComponent(card.filename);
+    if (event.target.closest('.style_card_checkbox')) {
+        toggleCardSelection(event, card.category, encodedFilename);
+    } else if (event.target.closest('.EditStyleJson button')) {
+        stylezWithPrompts(card, (prompt, negative) => {
+            editStyle(card.title, card.img, card.description, prompt, negative, card.category, encodedFilename, 'Catalog');
+        });
+    } else if (event.target.closest('.favouriteStyleBtn')) {
+        addFavourite(card.category, encodedFilename, event.target.closest('.favouriteStyleBtn'));
+    } else if (event.target.closest('.styles_overlay')) {
+        stylezWithPrompts(card, (prompt, negative) => {
+            applyStyle(prompt, negative, 'Catalog', element);
+            // clicking a selected card removes the style again, only count applying it
+            if (element.classList.contains('selected')) {
+                stylezRecordUse(card.id);
+            }
+        });
+    }
+}
+
+// style uses are collected for a moment and sent to /stylez/usage together
+let stylezUses = [];
+let stylezUsesTimer = null;
+function stylezRecordUse(id) {
+    stylezUses.push(id);
+    if (stylezUsesTimer === null) {
+        stylezUsesTimer = setTimeout(stylezSendUses, 2000);
+    }
+}
+
+function stylezSendUses() {
+    stylezUsesTimer = null;
+    const styles = stylezUses;
+    stylezUses = [];
+    fetch('stylez/usage', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({styles: styles}),
+        keepalive: true,
+    }).catch(error => console.error("Stylez: failed to record style use", error));
+}
+
+function stylezGridHover(event) {
+    const overlay = event.target.closest('.styles_overlay');
+    const target = overlay && stylezGridTarget(event);
+    if (!target || overlay === stylezGrid.hovered) {
+        return;
+    }
+    stylezGrid.hovered = overlay;
+    stylezWithPrompts(target.card, (prompt, negative) => {
+        if (stylezGrid.hovered === overlay) {
+            hoverPreviewStyle(prompt, negative, 'Catalog');
         }
+    });
+}
+
+function stylezGridHoverOut(event) {
+    const overlay = event.target.closest('.styles_overlay');
+    if (overlay && overlay === stylezGrid.hovered && !overlay.contains(event.relatedTarget)) {
+        stylezGrid.hovered = null;
+        hoverPreviewStyleOut();
     }
 }
 
+setInterval(() => {
+    const stylez = gradioApp().getElementById('Stylez');
+    if (stylez && stylez.style.display === 'block') {
+        stylezPollChanges();
+    }
+}, 3000);
+
+function stylezGridRender() {
+    const grid = stylezGrid.element;
+    if (!grid || !grid.isConnected) {
+        return;
+    }
+    // cards float left with a 5px margin on the sides and bottom
+    const size = stylezGrid.cardSize;
+    const columns = Math.max(1, Math.floor(stylezGrid.windowElement.clientWidth / (size + 10)));
+    const rowHeight = size + 5;
+    const rows = Math.ceil(stylezGrid.total / columns);
+    grid.style.height = rows * rowHeight + 'px';
+    const scroller = stylezGrid.scroller;
+    const viewTop = Math.max(0, scroller.getBoundingClientRect().top - grid.getBoundingClientRect().top);
+    const firstRow = Math.max(0, Math.floor(viewTop / rowHeight) - 2);
+    const lastRow = Math.min(rows, Math.ceil((viewTop + scroller.clientHeight) / rowHeight) + 2);
+    const first = firstRow * columns;
+    const last = Math.min(stylezGrid.total, lastRow * columns);
+    for (let page = Math.floor(first / stylezPageSize); page * stylezPageSize < last; page++) {
+        stylezGridFetch(page);
+    }
+    const fragment = document.createDocumentFragment();
+    for (let index = first; index < last; index++) {
+        const card = stylezGridCard(index);
+        fragment.appendChild(card ? stylezCardElement(card) : stylezCardPlaceholder());
+    }
+    stylezGrid.windowElement.style.transform = `translateY(${firstRow * rowHeight}px)`;
+    stylezGrid.windowElement.replaceChildren(fragment);
+    if (stylezGrid.elements.size > 2000) {
+        stylezGrid.elements = new Map();
+    }
+}
+
+function stylezCardSize(element) {
+    const size = stylezGrid.cardSize + 'px';
+    element.style.minHeight = size;
+    element.style.maxHeight = size;
+    element.style.minWidth = size;
+    element.style.maxWidth = size;
+}
+
+function stylezCardPlaceholder() {
+    const element = document.createElement('div');
+    element.className = 'style_card style_card_placeholder';
+    stylezCardSize(element);
+    return element;
+}
+
+function stylezCardElement(card) {
+    let element = stylezGrid.elements.get(card.id);
+    if (element) {
+        return element;
+    }
+    element = document.createElement('div');
+    element.className = 'style_card';
+    element.dataset.id = card.id;
+    element.dataset.category = card.category;
+    stylezCardSize(element);
+    const checkbox = document.createElement('div');
+    checkbox.className = 'style_card_checkbox';
+    checkbox.textContent = '◉';
+    if (stylezSelected.has(card.id)) {
+        element.classList.add('selected');
+    }
+    if (stylezBulkSelected.has(card.id)) {
+        checkbox.classList.add('checked');
+    }
+    const thumbnail = document.createElement('img');
+    thumbnail.className = 'styles_thumbnail';
+    thumbnail.alt = card.title + ' Preview';
+    if (card.srcset) {
+        thumbnail.srcset = card.srcset;
+        thumbnail.sizes = stylezGrid.cardSize + 'px';
+    }
+    thumbnail.src = card.src;
+    const edit = document.createElement('div');
+    edit.className = 'EditStyleJson';
+    const editButton = document.createElement('button');
+    editButton.textContent = '🖉';
+    edit.appendChild(editButton);
+    const favourite = document.createElement('div');
+    favourite.className = 'favouriteStyleJson';
+    const favouriteButton = document.createElement('button');
+    favouriteButton.className = 'favouriteStyleBtn';
+    favouriteButton.style.color = card.favourite ? '#EBD617' : '#ffffff';
+    favouriteButton.textContent = '★';
+    favourite.appendChild(favouriteButton);
+    const overlay = document.createElement('div');
+    overlay.className = 'styles_overlay';
+    const title = document.createElement('div');
+    title.className = 'styles_title';
+    title.textContent = card.title;
+    const description = document.createElement('p');
+    description.className = 'styles_description';
+    description.textContent = card.description;
+    element.append(checkbox, thumbnail, edit, favourite, overlay, title, description);
+    stylezGrid.elements.set(card.id, element);
+    return element;
+}
+
 function editStyle(title, img, description, prompt, promptNeggative, folder, filename,origin) {
     // title
     if (origin == "Stylez") {
         prompt = removeFirstAndLastCharacter(prompt)
         promptNeggative = removeFirstAndLastCharacter(promptNeggative)
-    } else {
+    } else if (origin != "Catalog") {
         prompt = decodeURIComponent(prompt).replaceAll(/%27/g, "'")
         promptNeggative = decodeURIComponent(promptNeggative.replaceAll(/%27/g, "'"))
     }
@@ -464,17 +861,30 @@ function grabCurrentSettings() {
 }
 
 function deleteRefresh() {
-    const galleryrefresh = gradioApp().querySelector('#style_refresh');
     const stylesclear = gradioApp().querySelector('#style_clear_btn');
-    galleryrefresh.click();
     stylesclear.click();
+    setTimeout(stylezPollChanges, 1000);
 }
 
 function saveRefresh() {
-    setTimeout(() => {
-        const galleryrefresh = gradioApp().querySelector('#style_refresh');
-        galleryrefresh.click();
-    }, 1000); // 1000 milliseconds = 1 second
+    setTimeout(stylezPollChanges, 1000); // 1000 milliseconds = 1 second
+}
+
+// bulk operations work on the ticked cards, their ids replace the hidden textbox value
+function stylezBulkArgs(op, category, template, ids) {
+    ids = Array.from(stylezBulkSelected).join('\n');
+    if (ids && op === '删除所选' && !confirm(`删除 ${stylezBulkSelected.size} 个风格？`)) {
+        ids = '';
+    }
+    return [op, category, template, ids];
+}
+
+function stylezBulkDone() {
+    stylezBulkSelected = new Set();
+    gradioApp().querySelectorAll('.style_card_checkbox.checked').forEach(checkbox => {
+        checkbox.classList.remove('checked');
+    });
+    stylezPollChanges();
 }
 
 function addFavourite(folder, filename, element) {
@@ -487,10 +897,12 @@ function addFavourite(folder, filename, element) {
         element.style.color = "#EBD617";
         applyValues(favTempFolder, folder + "/" + filename);
         addfavouritebtn.click();
+        stylezGridUpdateCard(folder + "/" + filename, {favourite: true});
     } else {
         element.style.color = "#ffffff";
         applyValues(favTempFolder, folder + "/" + filename);
         removefavouritebtn.click();
+        stylezGridUpdateCard(folder + "/" + filename, {favourite: false});
     }
 }
 
@@ -597,6 +1009,74 @@ function stylesgrabprompt() {
     return promptPos.value
 }
 
+// the size presets are plain buttons in one HTML block, a single listener
+// handles all of them and the nearest size calculator
+function stylezResolutionPanelInit() {
+    const panel = gradioApp().getElementById('stylez_resolution_panel');
+    if (!panel) {
+        return;
+    }
+    panel.addEventListener('click', (event) => {
+        const button = event.target.closest('.stylez_preset');
+        if (button) {
+            sendToARbox(parseInt(button.dataset.width), parseInt(button.dataset.height));
+        }
+    });
+    const model = panel.querySelector('.stylez_bucket_model');
+    model.addEventListener('change', () => {
+        panel.querySelector('.stylez_bucket_megapixels').value = model.value;
+        stylezBucketUpdate(panel);
+    });
+    panel.querySelector('.stylez_bucket_ratio').addEventListener('input', () => stylezBucketUpdate(panel));
+    panel.querySelector('.stylez_bucket_megapixels').addEventListener('input', () => stylezBucketUpdate(panel));
+    stylezBucketUpdate(panel);
+}
+
+function stylezBucketUpdate(panel) {
+    const result = panel.querySelector('.stylez_bucket_result');
+    const ratio = stylezParseRatio(panel.querySelector('.stylez_bucket_ratio').value);
+    const megapixels = parseFloat(panel.querySelector('.stylez_bucket_megapixels').value);
+    if (!ratio || !(megapixels > 0)) {
+        result.disabled = true;
+        result.textContent = '—';
+        return;
+    }
+    const [width, height] = stylezNearestBucket(ratio, megapixels);
+    result.disabled = false;
+    result.dataset.width = width;
+    result.dataset.height = height;
+    result.textContent = `${width}×${height} | ${(width / height).toFixed(2)}:1`;
+}
+
+// "16:9", "16x9", "2.39:1" or "2.39"
+function stylezParseRatio(text) {
+    const parts = text.trim().split(/\s*[:x×\/]\s*/);
+    const width = parseFloat(parts[0]);
+    const height = parts.length > 1 ? parseFloat(parts[1]) : 1;
+    return width > 0 && height > 0 ? width / height : null;
+}
+
+// the multiple-of-64 size closest to the ratio with an area closest to the
+// budget: start from the ideal real-valued size and score the few grid
+// points around it, ratio error counts twice as much as area error
+function stylezNearestBucket(ratio, megapixels, multiple = 64) {
+    const area = megapixels * 1e6;
+    const idealWidth = Math.sqrt(area * ratio) / multiple;
+    let best = null;
+    for (let w = Math.max(1, Math.floor(idealWidth) - 1); w <= Math.ceil(idealWidth) + 1; w++) {
+        const idealHeight = w / ratio;
+        for (let h = Math.max(1, Math.floor(idealHeight)); h <= Math.ceil(idealHeight); h++) {
+            const width = w * multiple;
+            const height = h * multiple;
+            const score = Math.abs(Math.log(width / height / ratio)) + 0.5 * Math.abs(Math.log(width * height / area));
+            if (best === null || score < best.score) {
+                best = {score: score, width: width, height: height};
+            }
+        }
+    }
+    return [best.width, best.height];
+}
+
 function sendToARbox(width, height) {
     // 获取txt2img的宽度和高度输入框
     var arWidthTxt2Img = gradioApp().querySelector(`#txt2img_width input`);
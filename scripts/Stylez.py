@@ -1,14 +1,37 @@
 import os
-import html
-import datetime
-import urllib.parse
 import gradio as gr
 from PIL import Image
-import shutil
 import json
+import html
 import csv
 import re
-from modules import scripts, shared,script_callbacks
+import io
+import hashlib
+import threading
+import atexit
+import copy
+import itertools
+import bisect
+import heapq
+import math
+import time
+import mmap
+import struct
+import mimetypes
+import shutil
+import concurrent.futures
+import contextlib
+import secrets
+import cProfile
+import pstats
+from functools import partial, lru_cache
+from typing import List
+from collections import namedtuple, deque, Counter
+from fastapi import FastAPI, Request, Response, HTTPException, Depends
+from fastapi.responses import FileResponse
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from pydantic import BaseModel
+from modules import scripts, shared,script_callbacks, processing
 from modules import (
     generation_parameters_copypaste as parameters_copypaste,  # type: ignore
 )
@@ -27,54 +50,628 @@ clear_symbol = '\U0001F9F9' #🧹
 card_size_value = 0
 card_size_min = 0
 card_size_max = 0
-favourites = []
 hideoldstyles = False
 config_json = os.path.join(extension_path,"scripts" ,"config.json")
+catalog_snapshot_json = os.path.join(extension_path, "scripts", "catalog_snapshot.json")
+catalog_snapshot_version = 1
+style_usage_json = os.path.join(extension_path, "scripts", "style_usage.json")
+# [width, height, ratio label, highlighted], copied into config.json where it can be edited
+default_resolution_presets = [
+    {"title": "宽度×高度（SDXL）:", "rows": [
+        [[1024, 1024, "1:1", True]],
+        [[576, 1728, "1:3"], [1728, 576, "3:1"], [576, 1664, "9:26"], [1664, 576, "26:9"]],
+        [[640, 1600, "2:5"], [1600, 640, "5:2"], [640, 1536, "5:12"], [1536, 640, "12:5"]],
+        [[704, 1472, "11:23"], [1472, 704, "23:11"], [704, 1408, "1:2"], [1408, 704, "2:1"]],
+        [[704, 1344, "11:21"], [1344, 704, "21:11"], [768, 1344, "4:7"], [1344, 768, "7:4", True]],
+        [[768, 1280, "3:5"], [1280, 768, "5:3"], [832, 1216, "13:19", True], [1216, 832, "19:13"]],
+        [[832, 1152, "13:18"], [1152, 832, "18:13"], [896, 1152, "7:9"], [1152, 896, "9:7"]],
+        [[896, 1088, "14:17"], [1088, 896, "17:14"], [960, 1088, "15:17"], [1088, 960, "17:15"]],
+        [[960, 1024, "15:16"], [1024, 960, "16:15"]],
+    ]},
+    {"title": "宽度×高度（SD1.5）:", "rows": [
+        [[512, 512, "1:1", True], [768, 768, "1:1"], [576, 1024, "9:16"], [1024, 576, "16:9"]],
+        [[512, 768, "2:3"], [768, 512, "3:2"], [576, 768, "3:4"], [768, 576, "4:3"]],
+    ]},
+    {"title": "宽度×高度（Custom）近似:", "rows": [
+        [[880, 1176, "3:4"], [1176, 880, "4:3"], [768, 1360, "9:16"], [1360, 768, "16:9"]],
+        [[1576, 656, "2.39:1"], [1392, 752, "1.85:1"], [1176, 888, "1.33:1"], [1568, 664, "2.35:1"]],
+        [[1312, 792, "1.66:1"], [1224, 856, "1.43:1"], [912, 1144, "4:5"], [1296, 800, "1.618:1"]],
+    ]},
+    {"title": "宽度×高度（Custom）强制:", "rows": [
+        [[720, 1280, "9:16"], [1280, 720, "16:9"], [800, 1280, "10:16"], [1280, 800, "16:10"]],
+    ]},
+]
+default_config = {
+    "card_size": 108,
+    "card_size_min": 50,
+    "card_size_max": 200,
+    "autoconvert": True,
+    "hide_old_styles": False,
+    "hide_duplicates": False,
+    "card_order": "default",
+    "duplicate_threshold": 0.85,
+    "resolution_presets": default_resolution_presets,
+    "favourites": []
+}
+
+
+class StylezMetrics:
+    """
+    Counters, gauges and timing spans for the backend hot paths
+    spans keep a count, total and max in seconds, everything is rendered in
+    the Prometheus text format and one refresh can be captured with cProfile
+    """
+
+    def __init__(self, profile_dir):
+        self.profile_dir = profile_dir
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.spans = {}
+        self.profile_armed = False
+        self.last_profile = None
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, seconds):
+        with self.lock:
+            span = self.spans.setdefault(name, [0, 0.0, 0.0])
+            span[0] += 1
+            span[1] += seconds
+            span[2] = max(span[2], seconds)
+
+    @contextlib.contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def arm_profile(self):
+        with self.lock:
+            self.profile_armed = True
+
+    @contextlib.contextmanager
+    def profile(self, name):
+        """run the block under cProfile if a capture was armed, the .prof file goes to cache/profiles"""
+        with self.lock:
+            armed, self.profile_armed = self.profile_armed, False
+        if not armed:
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profile_path = os.path.join(self.profile_dir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+            profiler.dump_stats(profile_path)
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(40)
+            with self.lock:
+                self.last_profile = {"path": profile_path, "stats": text.getvalue()}
+            print(f"Stylez: profile of {name} written to {profile_path}")
+
+    def render(self):
+        def labels_text(labels):
+            if not labels:
+                return ""
+            escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            spans = sorted((name, list(span)) for name, span in self.spans.items())
+        lines = []
+        for kind, suffix, samples in (("counter", "_total", counters), ("gauge", "", gauges)):
+            declared = set()
+            for (name, labels), value in samples:
+                metric = f"stylez_{name}{suffix}"
+                if metric not in declared:
+                    declared.add(metric)
+                    lines.append(f"# TYPE {metric} {kind}")
+                lines.append(f"{metric}{labels_text(labels)} {value}")
+        if spans:
+            lines.append("# TYPE stylez_span_seconds summary")
+            for name, (count, total, _) in spans:
+                lines.append(f'stylez_span_seconds_count{{span="{name}"}} {count}')
+                lines.append(f'stylez_span_seconds_sum{{span="{name}"}} {total:.6f}')
+            lines.append("# TYPE stylez_span_max_seconds gauge")
+            for name, (_, _, longest) in spans:
+                lines.append(f'stylez_span_max_seconds{{span="{name}"}} {longest:.6f}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = StylezMetrics(os.path.join(extension_path, "cache", "profiles"))
+
+
+def write_file_atomic(path, data):
+    # write next to the target and rename over it, readers never see a partial file
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+
+
+class SettingsStore:
+    """
+    config.json kept in memory behind a lock
+    changes are coalesced and written back by a background timer as one
+    atomic temp file + rename, favourites are held as sets per user
+    (the unnamed namespace is the shared "favourites" list)
+    """
+
+    def __init__(self, path, defaults, flush_delay=1.0):
+        self.path = path
+        self.flush_delay = flush_delay
+        self.lock = threading.RLock()
+        self.write_lock = threading.Lock()
+        self.timer = None
+        self.data = dict(defaults)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.data.update(json.load(f))
+        except FileNotFoundError:
+            self.schedule_flush()
+        except (OSError, ValueError) as e:
+            print(f"Stylez: could not read {path}, using defaults ({e})")
+        self.favourites = {None: set(self.data.get("favourites", []))}
+        for user, user_favourites in self.data.get("user_favourites", {}).items():
+            self.favourites[user] = set(user_favourites)
+
+    def get(self, setting, default=None):
+        with self.lock:
+            return self.data.get(setting, default)
+
+    def set(self, setting, value):
+        with self.lock:
+            self.data[setting] = value
+            self.schedule_flush()
+
+    def favourites_for(self, user=None):
+        with self.lock:
+            return frozenset(self.favourites.get(user or None, ()))
+
+    def add_favourite(self, style_id, user=None):
+        with self.lock:
+            user_favourites = self.favourites.setdefault(user or None, set())
+            if style_id in user_favourites:
+                return False
+            user_favourites.add(style_id)
+            self.schedule_flush()
+            return True
+
+    def remove_favourite(self, style_id, user=None):
+        with self.lock:
+            user_favourites = self.favourites.get(user or None, set())
+            if style_id not in user_favourites:
+                return False
+            user_favourites.discard(style_id)
+            self.schedule_flush()
+            return True
+
+    def replace_favourite(self, old_id, new_id):
+        """move old_id to new_id in every user's favourites"""
+        with self.lock:
+            changed = False
+            for user_favourites in self.favourites.values():
+                if old_id in user_favourites:
+                    user_favourites.discard(old_id)
+                    user_favourites.add(new_id)
+                    changed = True
+            if changed:
+                self.schedule_flush()
+            return changed
+
+    def schedule_flush(self):
+        with self.lock:
+            if self.timer is None:
+                self.timer = threading.Timer(self.flush_delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            data = dict(self.data)
+            data["favourites"] = sorted(self.favourites.get(None, ()))
+            user_favourites = {user: sorted(styles) for user, styles in self.favourites.items() if user is not None}
+            if user_favourites:
+                data["user_favourites"] = user_favourites
+        with self.write_lock, metrics.span("settings_flush"):
+            try:
+                write_file_atomic(self.path, json.dumps(data, indent=4, ensure_ascii=False).encode("utf-8"))
+                metrics.inc("settings_flushes")
+            except OSError as e:
+                metrics.inc("errors", kind="settings_write")
+                print(f"Stylez: could not write {self.path} ({e})")
+
+
+settings = SettingsStore(config_json, default_config)
+atexit.register(settings.flush)
+card_size_value = settings.get("card_size")
+card_size_min = settings.get("card_size_min")
+card_size_max = settings.get("card_size_max")
+autoconvert = settings.get("autoconvert")
+hide_old_styles = settings.get("hide_old_styles")
 
 def save_card_def(value):
     global card_size_value
     save_settings("card_size",value)
     card_size_value = value
-    
-if not os.path.exists(config_json):
-    default_config = {
-        "card_size": 108,
-        "card_size_min": 50,
-        "card_size_max": 200,
-        "autoconvert": True,
-        "hide_old_styles": False,
-        "favourites": []
-    }
-    
-    with open(config_json, 'w') as config_file:
-        json.dump(default_config, config_file, indent=4)
-
-# Load values from the JSON file
-with open(config_json, "r") as json_file:
-    data = json.load(json_file)
-    card_size_value = data["card_size"]
-    card_size_min = data["card_size_min"]
-    card_size_max = data["card_size_max"]
-    autoconvert = data["autoconvert"]
-    favourites = data["favourites"]
-    hide_old_styles = data["hide_old_styles"]
-
-def reload_favourites():
-    with open(config_json, "r") as json_file:
-        data = json.load(json_file)
-        global favourites
-        favourites = data["favourites"]
 
 def save_settings(setting,value):
-    with open(config_json, "r") as json_file:
-        data = json.load(json_file)
-    data[setting] = value
-    with open(config_json, "w") as json_file:
-        json.dump(data, json_file, indent=4)
+    metrics.inc("settings_changes", setting=setting)
+    settings.set(setting, value)
 
 def img_to_thumbnail(img):
+    if img and not os.path.isfile(img):
+        # previews of packed styles only exist inside their bundle
+        data = style_bundles.preview_for(img)
+        if data is not None:
+            img = Image.open(io.BytesIO(data))
     return gr.update(value=img)
 
+thumbnail_dir = os.path.join(extension_path, "cache", "thumbnails")
+
+
+def thumbnail_buckets():
+    # widths covering the card size slider, plus a 2x bucket for hidpi screens
+    return sorted({card_size_min, (card_size_min + card_size_max) // 2, card_size_max, card_size_max * 2})
+
+
+def build_thumbnails(src_path, buckets, out_dir, ext):
+    with open(src_path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha1(data).hexdigest()
+    missing = [bucket for bucket in buckets if not os.path.exists(os.path.join(out_dir, f"{digest}_{bucket}.{ext}"))]
+    if missing:
+        metrics.inc("thumbnails_built", len(missing))
+        with metrics.span("thumbnail_build"), Image.open(io.BytesIO(data)) as img:
+            img = img.convert("RGB")
+            for bucket in missing:
+                thumb = img.copy()
+                thumb.thumbnail((bucket, bucket), Image.LANCZOS)
+                buffer = io.BytesIO()
+                thumb.save(buffer, format="WEBP" if ext == "webp" else "JPEG", quality=80)
+                write_file_atomic(os.path.join(out_dir, f"{digest}_{bucket}.{ext}"), buffer.getvalue())
+    return digest
+
+
+class ThumbnailCache:
+    """
+    Content-hashed preview thumbnails at a few card size buckets
+    sources are tracked by (mtime, size) so a changed image is re-hashed and
+    gets a new thumbnail, identical images share one set of thumbnails
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.index = {}
+        self.verified = set()
+        self.pending = set()
+        self.sources = None
+        self.lock = threading.Lock()
+        self.executor = None
+        self.ext = None
+
+    def _setup(self):
+        if self.ext is not None:
+            return
+        from PIL import features
+        self.ext = "webp" if features.check("webp") else "jpg"
+        os.makedirs(self.cache_dir, exist_ok=True)
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+    def _exists(self, digest):
+        if digest in self.verified:
+            return True
+        if all(os.path.exists(self.path(digest, bucket)) for bucket in thumbnail_buckets()):
+            self.verified.add(digest)
+            return True
+        return False
+
+    def path(self, digest, bucket):
+        return os.path.join(self.cache_dir, f"{digest}_{bucket}.{self.ext}")
+
+    def lookup(self, src_path):
+        """return the digest of up-to-date thumbnails for src_path, or None and queue a build"""
+        try:
+            stat = os.stat(src_path)
+        except OSError:
+            return None
+        with self.lock:
+            self._setup()
+            record = self.index.get(src_path)
+            if record and record[0] == stat.st_mtime_ns and record[1] == stat.st_size:
+                # a null digest marks a source that failed to decode, don't retry until it changes
+                if record[2] is None or self._exists(record[2]):
+                    return record[2]
+        self.submit(src_path, stat)
+        return None
+
+    def submit(self, src_path, stat=None):
+        try:
+            stat = stat or os.stat(src_path)
+        except OSError:
+            return
+        with self.lock:
+            self._setup()
+            if src_path in self.pending:
+                return
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="stylez-thumbs")
+            self.pending.add(src_path)
+        future = self.executor.submit(build_thumbnails, src_path, thumbnail_buckets(), self.cache_dir, self.ext)
+        future.add_done_callback(partial(self._done, src_path, stat.st_mtime_ns, stat.st_size))
+
+    def _done(self, src_path, mtime, size, future):
+        with self.lock:
+            self.pending.discard(src_path)
+            try:
+                digest = future.result()
+                self.index[src_path] = [mtime, size, digest]
+                if self.sources is not None:
+                    self.sources[digest] = src_path
+            except Exception as e:
+                self.index[src_path] = [mtime, size, None]
+                metrics.inc("errors", kind="thumbnail_build")
+                print(f"Stylez: could not build thumbnail for {src_path} ({e})")
+            if not self.pending:
+                self._save_index()
+
+    def _save_index(self):
+        try:
+            write_file_atomic(self.index_path, json.dumps(self.index, ensure_ascii=False).encode("utf-8"))
+        except OSError as e:
+            print(f"Stylez: could not write thumbnail index ({e})")
+
+    def srcset(self, digest):
+        return ", ".join(f"{preview_url(digest, bucket)} {bucket}w" for bucket in thumbnail_buckets())
+
+    def source(self, digest):
+        """return the source image whose current content hashes to digest"""
+        with self.lock:
+            self._setup()
+            if self.sources is None:
+                self.sources = {record[2]: src for src, record in self.index.items() if record[2]}
+            src_path = self.sources.get(digest)
+            record = self.index.get(src_path)
+        if record is None:
+            return None
+        try:
+            stat = os.stat(src_path)
+        except OSError:
+            return None
+        return src_path if (stat.st_mtime_ns, stat.st_size) == (record[0], record[1]) else None
+
+
+thumbnail_cache = ThumbnailCache(thumbnail_dir)
+
+
+def preview_url(digest, bucket=None):
+    # relative so it also resolves when the WebUI is served under a subpath
+    if bucket is None:
+        return f"stylez/preview/{digest}"
+    return f"stylez/preview/{digest}/{bucket}"
+
+
+def preview_response(request: Request, etag, path, data=None):
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if "*" in tags or headers["ETag"] in tags:
+        metrics.inc("preview_requests", status="304")
+        return Response(status_code=304, headers=headers)
+    metrics.inc("preview_requests", status="200")
+    if data is not None:
+        # a packed preview, path is only its name inside the bundle
+        return Response(data, media_type=mimetypes.guess_type(path)[0] or "application/octet-stream", headers=headers)
+    return FileResponse(path, headers=headers)
+
+
+def json_response(payload, endpoint):
+    # serialized here rather than by fastapi so the payload size can be counted
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    metrics.inc("payload_bytes", len(body), endpoint=endpoint)
+    return Response(body, media_type="application/json")
+
+
+def request_user(app, request: Request):
+    # same lookup gradio does for gr.Request.username when --gradio-auth is on
+    tokens = getattr(app, "tokens", None) or {}
+    return tokens.get(request.cookies.get("access-token")) or tokens.get(request.cookies.get("access-token-unsecure"))
+
+
+def api_auth_dependencies():
+    # the same check the WebUI applies to /sdapi routes when --api-auth is set
+    if not getattr(shared.cmd_opts, "api_auth", None):
+        return []
+    credentials = dict(item.split(":", 1) for item in shared.cmd_opts.api_auth.split(",") if ":" in item)
+
+    def auth(credential: HTTPBasicCredentials = Depends(HTTPBasic())):
+        password = credentials.get(credential.username)
+        if password is not None and secrets.compare_digest(credential.password, password):
+            return True
+        raise HTTPException(status_code=401, detail="Incorrect username or password", headers={"WWW-Authenticate": "Basic"})
+    return [Depends(auth)]
+
+
+def add_api_routes(demo, app: FastAPI):
+    digest_pattern = re.compile(r"^[0-9a-f]{40}$")
+
+    @app.get("/stylez/preview/{digest}")
+    def stylez_preview(request: Request, digest: str):
+        if not digest_pattern.match(digest):
+            raise HTTPException(status_code=404)
+        src_path = thumbnail_cache.source(digest)
+        if src_path is not None:
+            return preview_response(request, digest, src_path)
+        packed = style_bundles.preview(digest)
+        if packed is None:
+            raise HTTPException(status_code=404)
+        data, name = packed
+        return preview_response(request, digest, name, data)
+
+    @app.get("/stylez/preview/{digest}/{bucket}")
+    def stylez_preview_thumbnail(request: Request, digest: str, bucket: int):
+        if not digest_pattern.match(digest) or bucket not in thumbnail_buckets():
+            raise HTTPException(status_code=404)
+        thumb_path = thumbnail_cache.path(digest, bucket)
+        if not os.path.exists(thumb_path):
+            raise HTTPException(status_code=404)
+        return preview_response(request, f"{digest}_{bucket}", thumb_path)
+
+    @app.get("/stylez/cards")
+    def stylez_cards(request: Request, category: str = "All", q: str = "", page: int = 0, size: int = 120, order: str = "default"):
+        return json_response(list_cards(category, q, page, size, request_user(app, request), order), "cards")
+
+    @app.get("/stylez/changes")
+    def stylez_changes(request: Request, since: int = 0):
+        return json_response(list_changes(since, request_user(app, request)), "changes")
+
+    @app.get("/stylez/prompts")
+    def stylez_prompts(ids: str = ""):
+        # prompt texts by key, for cards whose page table the client no longer holds
+        return json_response(prompt_table.get(key for key in ids.split(",") if key), "prompts")
+
+    @app.post("/stylez/apply")
+    def stylez_apply(body: StyleApplyRequest):
+        start = time.perf_counter()
+        try:
+            prompts, negative_prompts = compose_prompts(body.styles, body.prompts, body.negative_prompts)
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=f"Unknown styles: {e.args[0]}")
+        took_ms = (time.perf_counter() - start) * 1000
+        metrics.observe("compose_prompts", took_ms / 1000)
+        return {
+            "prompts": prompts,
+            "negative_prompts": negative_prompts,
+            "took_ms": round(took_ms, 3),
+            "prompts_per_ms": round(len(prompts) / max(took_ms, 1e-3), 1),
+        }
+
+    @app.post("/stylez/usage")
+    def stylez_usage(request: Request, body: StyleUsageRequest):
+        style_ids = [style_id for style_id in body.styles[:100] if style_catalog.get(style_id) is not None]
+        style_usage.record(style_ids, request_user(app, request))
+        return {"recorded": len(style_ids)}
+
+    @app.get("/stylez/usage")
+    def stylez_usage_ranking(request: Request, order: str = "usage", limit: int = 50):
+        ranked = [style_id for style_id in style_usage.ranked(request_user(app, request), order) if style_catalog.get(style_id) is not None]
+        return {"ids": ranked[:max(0, limit)]}
+
+    @app.get("/stylez/search")
+    def stylez_search(request: Request, q: str = "", category: str = "All", limit: int = 50, order: str = "default"):
+        start = time.perf_counter()
+        styles, total = search_styles(q, category, max(1, min(limit, 1000)), request_user(app, request), order)
+        metrics.observe("search", time.perf_counter() - start)
+        return {"ids": [style["id"] for style in styles], "total": total, "took_ms": round((time.perf_counter() - start) * 1000, 3)}
+
+    @app.get("/stylez/bundles")
+    def stylez_bundles():
+        with style_bundles.lock:
+            bundles = list(style_bundles.bundles.values())
+        return [{"path": bundle.path, "category": bundle.category, "styles": len(bundle.styles), "bytes": bundle.stamp[1]} for bundle in bundles]
+
+    @app.get("/stylez/duplicates")
+    def stylez_duplicates(threshold: float = 0.85, limit: int = 200):
+        start = time.perf_counter()
+        clusters = duplicate_index.clusters(style_catalog, max(0.1, min(threshold, 1.0)))
+        return json_response({
+            "threshold": threshold,
+            "styles": len(style_catalog.styles),
+            "clusters": len(clusters),
+            "duplicates": sum(len(cluster["members"]) - 1 for cluster in clusters),
+            "took_ms": round((time.perf_counter() - start) * 1000, 3),
+            "items": clusters[:max(0, limit)],
+        }, "duplicates")
+
+    @app.get("/stylez/status")
+    def stylez_status():
+        return startup.status()
+
+    @app.get("/stylez/metrics")
+    def stylez_metrics():
+        return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    # routes that change files on disk, or expose server paths like the profiler,
+    # only exist with --api, behind its auth, like the WebUI's own /sdapi endpoints
+    if not getattr(shared.cmd_opts, "api", False):
+        return
+    dependencies = api_auth_dependencies()
+
+    @app.post("/stylez/profile", dependencies=dependencies)
+    def stylez_profile_arm():
+        # the next refresh of the style list runs under cProfile
+        metrics.arm_profile()
+        return {"armed": True}
+
+    @app.get("/stylez/profile", dependencies=dependencies)
+    def stylez_profile():
+        if metrics.last_profile is None:
+            raise HTTPException(status_code=404, detail="No refresh has been profiled yet")
+        return Response(f"{metrics.last_profile['path']}\n\n{metrics.last_profile['stats']}", media_type="text/plain; charset=utf-8")
+
+    @app.post("/stylez/bundles/pack", dependencies=dependencies)
+    def stylez_bundles_pack(body: BundleRequest):
+        # under the update lock so a rescan never reads a bundle being replaced
+        try:
+            with catalog_update_lock:
+                result = pack_category(body.category, body.remove_source)
+        except (OSError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        update_catalog()
+        return result
+
+    @app.post("/stylez/bundles/unpack", dependencies=dependencies)
+    def stylez_bundles_unpack(body: BundleRequest):
+        try:
+            with catalog_update_lock:
+                result = unpack_bundle(body.category, body.remove_source)
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        update_catalog()
+        return result
+
+    @app.post("/stylez/bulk", dependencies=dependencies)
+    def stylez_bulk(body: BulkEditRequest):
+        try:
+            return style_writer.submit(f"bulk {body.op}", bulk_edit_styles, body.op, body.styles, body.category, body.template).result()
+        except (OSError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @app.post("/stylez/duplicates/merge", dependencies=dependencies)
+    def stylez_duplicates_merge(body: DuplicateMergeRequest):
+        try:
+            return style_writer.submit("merge duplicates", merge_duplicates, max(0.1, min(body.threshold, 1.0)), body.keep).result()
+        except OSError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
 character_translation_table = str.maketrans('"*/:<>?\\|\t\n\v\f\r', '＂＊／：＜＞？＼￨     ')
 leading_space_or_dot_pattern = re.compile(r'^[\s.]')
 
@@ -104,7 +701,7 @@ def replace_illegal_filename_characters(input_filename: str):
 
 
 def create_json_objects_from_csv(csv_file):
-    json_objects = []
+    # generator, rows are converted as the file is read so a big styles.csv is never held in memory
     with open(csv_file, 'r', newline='', encoding='utf-8-sig') as csvfile:
         reader = csv.DictReader(csvfile)
         for row in reader:
@@ -113,41 +710,93 @@ def create_json_objects_from_csv(csv_file):
             prompt = row.get('prompt', None)
             negative_prompt = row.get('negative_prompt', None)
             if name is None or prompt is None or negative_prompt is None:
+                metrics.inc("csv_rows_skipped")
                 print("Warning: Skipping row with missing values.")
                 continue
             safe_name = replace_illegal_filename_characters(name)
-            json_data = {
+            # no preview is copied, styles without their own jpg fall back to the shared nopreview.jpg
+            yield {
                 "name": safe_name,
                 "description": "converted from csv",
                 "preview": f"{safe_name}.jpg",
                 "prompt": prompt,
                 "negative": negative_prompt,
             }
-            json_objects.append(json_data)
-    return json_objects
 
-def save_json_objects(json_objects):
-    if not json_objects:
-        print("Warning: No JSON objects to save.")
-        return
+def write_json_object(csv_conversion_dir, json_obj):
+    json_file_path = os.path.join(csv_conversion_dir, f"{json_obj['name']}.json")
+    write_file_atomic(json_file_path, json.dumps(json_obj, indent=4).encode("utf-8"))
+
+# outside styles/, every json in there is read as a style
+csv_import_manifest = os.path.join(extension_path, "cache", "csv_import.json")
+
 
+def save_json_objects(json_objects, batch_size=256):
     styles_dir = os.path.join(extension_path, "styles")
     csv_conversion_dir = os.path.join(styles_dir, "CSVConversion")
-    os.makedirs(csv_conversion_dir, exist_ok=True)
+    manifest_path = csv_import_manifest
+    old_manifest_path = os.path.join(csv_conversion_dir, ".csv_import.json")
+    if os.path.exists(old_manifest_path):
+        # earlier versions kept it next to the styles, where it showed up as an empty card
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        os.replace(old_manifest_path, manifest_path)
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
 
-    nopreview_image_path = os.path.join(extension_path, "nopreview.jpg")
-    for json_obj in json_objects:
-        try:
-            json_file_path = os.path.join(csv_conversion_dir, f"{json_obj['name']}.json")
-            with open(json_file_path, 'w') as jsonfile:
-                json.dump(json_obj, jsonfile, indent=4)
-            image_path = os.path.join(csv_conversion_dir, f"{json_obj['name']}.jpg")
-            shutil.copy(nopreview_image_path, image_path)
-        except Exception as e:
-            print(f'{e}\nStylez Failed to convert {json_obj.get("name", str(json_obj))}')
+    report = {"rows": 0, "written": 0, "unchanged": 0, "failed": 0, "duplicate": 0}
+    start = time.perf_counter()
+    json_objects = iter(json_objects)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="stylez-import") as executor:
+        while True:
+            batch = list(itertools.islice(json_objects, batch_size))
+            if not batch:
+                break
+            report["rows"] += len(batch)
+            # rows of the same name are written concurrently otherwise, the last one wins
+            rows = {json_obj["name"]: json_obj for json_obj in batch}
+            report["duplicate"] += len(batch) - len(rows)
+            pending = {}
+            for json_obj in rows.values():
+                digest = hashlib.sha1(json.dumps(json_obj, sort_keys=True).encode("utf-8")).hexdigest()
+                json_file_path = os.path.join(csv_conversion_dir, f"{json_obj['name']}.json")
+                if manifest.get(json_obj["name"]) == digest and os.path.exists(json_file_path):
+                    report["unchanged"] += 1
+                else:
+                    pending[json_obj["name"]] = (digest, json_obj)
+            if pending:
+                # created for the first row to write, an empty csv must not add an empty category
+                os.makedirs(csv_conversion_dir, exist_ok=True)
+            futures = {name: (digest, executor.submit(write_json_object, csv_conversion_dir, json_obj)) for name, (digest, json_obj) in pending.items()}
+            for name, (digest, future) in futures.items():
+                try:
+                    future.result()
+                    manifest[name] = digest
+                    report["written"] += 1
+                except Exception as e:
+                    report["failed"] += 1
+                    print(f'{e}\nStylez Failed to convert {name}')
 
-        
-if autoconvert:
+    if not report["rows"]:
+        print("Warning: No JSON objects to save.")
+        return report
+    if report["written"]:
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        write_file_atomic(manifest_path, json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    metrics.observe("csv_import", report["seconds"])
+    for outcome in ("written", "unchanged", "failed", "duplicate"):
+        metrics.inc("csv_rows", report[outcome], outcome=outcome)
+    print(f"Stylez CSV import: {report['rows']} rows, {report['written']} written, {report['unchanged']} unchanged, "
+          f"{report['failed']} failed, {report['duplicate']} duplicate names in {report['seconds']}s ({report['rows'] / max(report['seconds'], 1e-6):.0f} rows/s)")
+    return report
+
+
+def run_autoconvert():
+    if not settings.get("autoconvert"):
+        return
     styles_files = shared.cmd_opts.styles_file if isinstance(shared.cmd_opts.styles_file, list) else [shared.cmd_opts.styles_file]
     for styles_file_path in styles_files:
         if os.path.exists(styles_file_path):
@@ -159,75 +808,1888 @@ if autoconvert:
     save_settings("autoconvert", False)
 
 
-def generate_html_code():
-    reload_favourites()
-    style = None
-    style_html = ""
-    categories_list = ["All","Favourites"]
-    save_categories_list =[]
-    styles_dir = os.path.join(extension_path, "styles")
-    current_time = datetime.datetime.now()
-    formatted_time = current_time.strftime('%H:%M:%S.%f')
-    formatted_time = formatted_time.replace(":", "")
-    formatted_time = formatted_time.replace(".", "")
+bundle_extension = ".stylez"
+bundle_magic = b"STYLEZPK"
+bundle_version = 1
+# magic, format version, length of the JSON index that follows
+bundle_header = struct.Struct("<8sIQ")
+
+
+def bundle_member(path):
+    """split a "bundle::filename" catalog path, returns (None, path) for loose files"""
+    bundle_path, separator, filename = path.rpartition("::")
+    return (bundle_path, filename) if separator else (None, path)
+
+
+def check_category(category):
+    if not category or os.path.basename(category) != category or category.startswith("."):
+        raise ValueError(f"invalid category: {category!r}")
+    return category
+
+
+class StyleBundle:
+    """
+    Read-only view of a packed .stylez category
+    header, JSON index, then the style JSON and preview blobs back to back;
+    the file is mapped once and blobs are memoryview slices of the mapping
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.stamp = (stat.st_mtime_ns, stat.st_size)
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, index_length = bundle_header.unpack_from(self.map, 0)
+            if magic != bundle_magic or version != bundle_version:
+                raise ValueError(f"not a version {bundle_version} style bundle")
+            self.base = bundle_header.size + index_length
+            self.view = memoryview(self.map)
+            index = json.loads(str(self.view[bundle_header.size:self.base], "utf-8"))
+        except Exception:
+            self.close()
+            raise
+        try:
+            # bundles get copied between machines, names from the index become paths
+            self.category = check_category(index["category"])
+            self.styles = index["styles"]
+            for filename in self.styles:
+                if os.path.basename(filename) != filename or not filename.endswith(".json"):
+                    raise ValueError(f"invalid style file name: {filename!r}")
+        except Exception:
+            self.close()
+            raise
+
+    def blob(self, span):
+        offset, length = span[0], span[1]
+        if self.base + offset + length > len(self.map):
+            raise ValueError(f"blob past the end of {self.path}")
+        return self.view[self.base + offset:self.base + offset + length]
+
+    def style(self, filename):
+        return json.loads(str(self.blob(self.styles[filename]["meta"]), "utf-8"))
+
+    def close(self):
+        view = getattr(self, "view", None)
+        if view is not None:
+            view.release()
+        self.map.close()
+
+
+def write_bundle(bundle_path, category, members):
+    """members are (filename, style json bytes, preview name, preview bytes or None)"""
+    index = {"category": category, "styles": {}}
+    blobs = []
+    offset = 0
+    for filename, meta, preview_name, preview in members:
+        entry = {"meta": [offset, len(meta)], "preview": None}
+        blobs.append(meta)
+        offset += len(meta)
+        if preview is not None:
+            entry["preview"] = [offset, len(preview), hashlib.sha1(preview).hexdigest(), preview_name]
+            blobs.append(preview)
+            offset += len(preview)
+        index["styles"][filename] = entry
+    index_bytes = json.dumps(index, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    # a mapped file can't be replaced on windows
+    style_bundles.release(bundle_path)
+    write_file_atomic(bundle_path, b"".join([bundle_header.pack(bundle_magic, bundle_version, len(index_bytes)), index_bytes, *blobs]))
+    return len(index["styles"])
+
+
+class BundleStore:
+    """
+    Open bundles by path, reopened when the file changes
+    also maps preview digests to their blobs for /stylez/preview
+    """
+
+    def __init__(self):
+        self.bundles = {}
+        self.previews = {}
+        self.lock = threading.Lock()
+
+    def open(self, path, stamp=None):
+        with self.lock:
+            bundle = self.bundles.get(path)
+            if bundle is not None and stamp is not None and bundle.stamp == stamp:
+                return bundle
+            if bundle is not None:
+                self._drop(path)
+            bundle = StyleBundle(path)
+            self.bundles[path] = bundle
+            for entry in bundle.styles.values():
+                if entry["preview"]:
+                    self.previews[entry["preview"][2]] = (path, entry["preview"])
+            return bundle
+
+    def _drop(self, path):
+        bundle = self.bundles.pop(path, None)
+        if bundle is not None:
+            self.previews = {digest: ref for digest, ref in self.previews.items() if ref[0] != path}
+            bundle.close()
+
+    def release(self, path):
+        with self.lock:
+            self._drop(path)
+
+    def retain(self, paths):
+        with self.lock:
+            for path in [path for path in self.bundles if path not in paths]:
+                self._drop(path)
+
+    def preview(self, digest):
+        """return (preview bytes, preview name) or None"""
+        with self.lock:
+            ref = self.previews.get(digest)
+            bundle = ref and self.bundles.get(ref[0])
+            if bundle is None:
+                return None
+            return bytes(bundle.blob(ref[1])), ref[1][3]
+
+    def preview_for(self, img):
+        """resolve a "bundle::preview" card image to its bytes"""
+        bundle_path, preview_name = bundle_member(img)
+        if bundle_path is None:
+            return None
+        with self.lock:
+            bundle = self.bundles.get(bundle_path)
+            for entry in (bundle.styles.values() if bundle else ()):
+                if entry["preview"] and entry["preview"][3] == preview_name:
+                    return bytes(bundle.blob(entry["preview"]))
+        return None
+
+
+style_bundles = BundleStore()
+
+
+def bundle_path_for(category):
+    return os.path.join(extension_path, "styles", check_category(category) + bundle_extension)
+
+
+def pack_category(category, remove_loose=False):
+    """pack styles/<category>/*.json and their previews into styles/<category>.stylez"""
+    bundle_path = bundle_path_for(category)
+    category_dir = os.path.join(extension_path, "styles", category)
+    members, packed = [], []
+    for entry in sorted(os.scandir(category_dir), key=lambda e: e.name):
+        if not entry.is_file() or not entry.name.endswith(".json"):
+            continue
+        with open(entry.path, "rb") as f:
+            meta = f.read()
+        try:
+            preview_name = json.loads(meta.decode("utf-8")).get("preview", "")
+        except (UnicodeDecodeError, ValueError, AttributeError) as e:
+            print(f"Stylez: not packing {entry.name} ({e})")
+            continue
+        preview_path = os.path.join(category_dir, preview_name) if preview_name else None
+        preview = None
+        if preview_path and os.path.isfile(preview_path):
+            with open(preview_path, "rb") as f:
+                preview = f.read()
+        members.append((entry.name, meta, os.path.basename(preview_name), preview))
+        # a preview outside the folder (a bulk move writes ../Other/x.jpg) is
+        # packed as a copy but stays on disk, other styles may still use it
+        owned = preview is not None and os.path.dirname(os.path.realpath(preview_path)) == os.path.realpath(category_dir)
+        packed.append((entry.path, preview_path if owned else None))
+    count = write_bundle(bundle_path, category, members)
+    if remove_loose:
+        for json_path, preview_path in packed:
+            os.remove(json_path)
+            if preview_path and os.path.exists(preview_path):
+                os.remove(preview_path)
+        if not os.listdir(category_dir):
+            os.rmdir(category_dir)
+    return {"bundle": bundle_path, "styles": count}
+
+
+def unpack_bundle(category, remove_bundle=False):
+    """write the styles of styles/<category>.stylez back out as loose files"""
+    bundle_path = bundle_path_for(category)
+    bundle = StyleBundle(bundle_path)
+    # the folder is the one asked for, whatever category the index names
+    category_dir = os.path.join(extension_path, "styles", category)
+    os.makedirs(category_dir, exist_ok=True)
     try:
-        for root, dirs, _ in os.walk(styles_dir):
-            for directory in dirs:
-                subfolder_name = os.path.basename(os.path.join(root, directory))
-                if subfolder_name.lower() not in categories_list:
-                    categories_list.append(subfolder_name)
-                if subfolder_name.lower() not in save_categories_list:
-                    save_categories_list.append(subfolder_name)    
-        for root, _, files in os.walk(styles_dir):
-            for filename in files:
-                if filename.endswith(".json"):
-                    json_file_path = os.path.join(root, filename)
-                    subfolder_name = os.path.basename(root)
-                    with open(json_file_path, "r", encoding="utf-8") as f:
-                        try:
-                            style = json.load(f)
-                            title = style.get("name", "")
-                            preview_image = style.get("preview", "")
-                            description = style.get("description", "")
-                            img = os.path.join(os.path.dirname(json_file_path), preview_image)
-                            img = os.path.abspath(img)
-                            prompt = style.get("prompt", "")
-                            prompt = html.escape(json.dumps(prompt))
-                            prompt_negative = style.get("negative", "")
-                            prompt_negative =html.escape(json.dumps(prompt_negative))
-                            imghack = img.replace("\\", "/")
-                            json_file_path = json_file_path.replace("\\", "/")
-                            encoded_filename = urllib.parse.quote(filename, safe="")
-                            titlelower = str(title).lower()
-                            color = ""
-                            stylefavname =subfolder_name + "/" + filename
-                            if (stylefavname in favourites):
-                                color = "#EBD617"
-                            else:
-                                color = "#ffffff"
-                            style_html += f"""
-                            <div class="style_card" data-category='{subfolder_name}' data-title='{titlelower}' style="min-height:{card_size_value}px;max-height:{card_size_value}px;min-width:{card_size_value}px;max-width:{card_size_value}px;">
-                                <div class="style_card_checkbox" onclick="toggleCardSelection(event, '{subfolder_name}','{encoded_filename}')">◉</div>  <!-- 这里添加勾选框 -->
-                                <img class="styles_thumbnail" src="{"file=" + img +"?timestamp"+ formatted_time}" alt="{title} Preview">
-                                <div class="EditStyleJson">
-                                    <button onclick="editStyle(`{title}`,`{imghack}`,`{description}`,`{prompt}`,`{prompt_negative}`,`{subfolder_name}`,`{encoded_filename}`,`Stylez`)">🖉</button>
-                                </div>
-                                <div class="favouriteStyleJson">
-                                    <button class="favouriteStyleBtn" style="color:{color};" onclick="addFavourite('{subfolder_name}','{encoded_filename}', this)">★</button>
-                                </div>
-                                    <div onclick="applyStyle(`{prompt}`,`{prompt_negative}`,`Stylez`)" onmouseenter="event.stopPropagation(); hoverPreviewStyle(`{prompt}`,`{prompt_negative}`,`Stylez`)" onmouseleave="hoverPreviewStyleOut()" class="styles_overlay"></div>
-                                    <div class="styles_title">{title}</div>
-                                    <p class="styles_description">{description}</p>
-                                </img>
-                            </div>
-                            """
-                        except json.JSONDecodeError:
-                            print(f"Error parsing JSON in file: {filename}")
-                        except KeyError as e:
-                            print(f"KeyError: {e} in file: {filename}")
-    except FileNotFoundError:
-        print("Directory '/models/styles' not found.")
-    return style_html, categories_list, save_categories_list
+        for filename, entry in bundle.styles.items():
+            blobs = [(filename, entry["meta"])]
+            if entry["preview"]:
+                blobs.append((entry["preview"][3], entry["preview"]))
+            for name, span in blobs:
+                write_file_atomic(os.path.join(category_dir, os.path.basename(name)), bundle.blob(span))
+        count = len(bundle.styles)
+    finally:
+        bundle.close()
+    if remove_bundle:
+        style_bundles.release(bundle_path)
+        os.remove(bundle_path)
+    return {"folder": category_dir, "styles": count}
+
+
+class BundleRequest(BaseModel):
+    category: str
+    remove_source: bool = False
+
+
+CatalogDiff = namedtuple("CatalogDiff", ["added", "changed", "removed"])
+
+
+class StyleCatalog:
+    """
+    In-memory index of the style library keyed by (category, filename)
+    every entry remembers the mtime and size of its JSON file, so a rescan
+    only re-parses files that were added or changed and drops removed ones
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.styles = {}
+        self.categories = []
+        self.broken = {}
+        self.dirs = {}
+        self.lock = threading.RLock()
+
+    def _walk(self, path, found, categories, dirs, trusted, bundles):
+        try:
+            dir_mtime = os.stat(path).st_mtime_ns
+            entries = sorted(os.scandir(path), key=lambda e: e.name)
+        except FileNotFoundError:
+            print(f"Directory '{path}' not found.")
+            return
+        dirs[path] = dir_mtime
+        # a directory whose mtime is unchanged had no files added, removed or
+        # renamed, so the stamps we already hold for it can be reused unstat-ed
+        trust = trusted.get(path) == dir_mtime
+        category = os.path.basename(path)
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir():
+                subdirs.append(entry)
+                if entry.name not in categories:
+                    categories.append(entry.name)
+            elif entry.name.endswith(bundle_extension):
+                self._walk_bundle(entry, found, categories, bundles)
+            elif entry.name.endswith(".json"):
+                key = (category, entry.name)
+                old = self.styles.get(key)
+                if trust and old is not None and old["path"] == entry.path:
+                    found[key] = (entry.path, old["mtime"], old["size"])
+                    continue
+                stat = entry.stat()
+                found[key] = (entry.path, stat.st_mtime_ns, stat.st_size)
+        for entry in subdirs:
+            self._walk(entry.path, found, categories, dirs, trusted, bundles)
+
+    def _walk_bundle(self, entry, found, categories, bundles):
+        # bundles are always stat-ed, it is one call for a whole category
+        try:
+            stat = entry.stat()
+            bundle = style_bundles.open(entry.path, (stat.st_mtime_ns, stat.st_size))
+        except (OSError, ValueError, KeyError, TypeError, struct.error) as e:
+            metrics.inc("errors", kind="bundle")
+            print(f"Stylez: could not read bundle {entry.path} ({e})")
+            return
+        bundles.add(entry.path)
+        if bundle.category not in categories:
+            categories.append(bundle.category)
+        for filename in bundle.styles:
+            # a loose file of the same category and name overrides the packed one
+            found.setdefault((bundle.category, filename), (f"{entry.path}::{filename}", stat.st_mtime_ns, stat.st_size))
+
+    def _parse(self, key, path, mtime, size):
+        category, filename = key
+        bundle_path, member = bundle_member(path)
+        if bundle_path is not None:
+            return self._parse_packed(key, path, mtime, size, bundle_path, member)
+        with open(path, "r", encoding="utf-8") as f:
+            style = json.load(f)
+        preview = style.get("preview", "")
+        return {
+            "id": category + "/" + filename,
+            "category": category,
+            "filename": filename,
+            "path": path,
+            "mtime": mtime,
+            "size": size,
+            "name": style.get("name", ""),
+            "description": style.get("description", ""),
+            "preview": preview,
+            "img": os.path.abspath(os.path.join(os.path.dirname(path), preview)),
+            "prompt": style.get("prompt", ""),
+            "negative": style.get("negative", ""),
+        }
+
+    def _parse_packed(self, key, path, mtime, size, bundle_path, member):
+        category, filename = key
+        bundle = style_bundles.open(bundle_path, (mtime, size))
+        style = bundle.style(member)
+        preview = bundle.styles[member]["preview"]
+        return {
+            "id": category + "/" + filename,
+            "category": category,
+            "filename": filename,
+            "path": path,
+            "mtime": mtime,
+            "size": size,
+            "name": style.get("name", ""),
+            "description": style.get("description", ""),
+            "preview": style.get("preview", ""),
+            "img": f"{bundle_path}::{preview[3]}" if preview else "",
+            "preview_digest": preview[2] if preview else None,
+            "bundle": bundle_path,
+            "prompt": style.get("prompt", ""),
+            "negative": style.get("negative", ""),
+        }
+
+    def rescan(self, trust_dirs=False):
+        found = {}
+        categories = []
+        dirs = {}
+        bundles = set()
+        with metrics.span("catalog_walk"):
+            self._walk(self.root, found, categories, dirs, self.dirs if trust_dirs else {}, bundles)
+        style_bundles.retain(bundles)
+        with self.lock, metrics.span("catalog_parse"):
+            styles = {}
+            added, changed = [], []
+            for key, (path, mtime, size) in found.items():
+                old = self.styles.get(key)
+                if old is not None and old["mtime"] == mtime and old["size"] == size:
+                    styles[key] = old
+                    continue
+                if self.broken.get(key) == (mtime, size):
+                    continue
+                try:
+                    styles[key] = self._parse(key, path, mtime, size)
+                    self.broken.pop(key, None)
+                except (OSError, ValueError, KeyError, AttributeError) as e:
+                    metrics.inc("errors", kind=type(e).__name__)
+                    print(f"Error parsing JSON in file: {key[1]} ({e})")
+                    self.broken[key] = (mtime, size)
+                    continue
+                (added if old is None else changed).append(key)
+            removed = [key for key in self.styles if key not in styles]
+            for key in list(self.broken):
+                if key not in found:
+                    del self.broken[key]
+            self.styles = styles
+            self.categories = categories
+            self.dirs = dirs
+        metrics.inc("styles_parsed", len(added) + len(changed))
+        metrics.set("library_styles", len(styles))
+        metrics.set("library_categories", len(categories))
+        metrics.set("library_broken", len(self.broken))
+        return CatalogDiff(added, changed, removed)
+
+    def load_snapshot(self, snapshot_path):
+        try:
+            with open(snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            print(f"Stylez: ignoring unreadable catalog snapshot ({e})")
+            return False
+        if snapshot.get("version") != catalog_snapshot_version or snapshot.get("root") != self.root:
+            return False
+        with self.lock:
+            self.styles = {(style["category"], style["filename"]): style for style in snapshot["styles"]}
+            self.categories = snapshot["categories"]
+            self.dirs = snapshot["dirs"]
+        return True
+
+    def save_snapshot(self, snapshot_path):
+        with self.lock:
+            snapshot = {
+                "version": catalog_snapshot_version,
+                "root": self.root,
+                "dirs": self.dirs,
+                "categories": self.categories,
+                "styles": list(self.styles.values()),
+            }
+        try:
+            write_file_atomic(snapshot_path, json.dumps(snapshot, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        except OSError as e:
+            print(f"Stylez: could not write catalog snapshot ({e})")
+
+    def entries(self):
+        with self.lock:
+            return list(self.styles.values())
+
+    def get(self, style_id):
+        category, _, filename = str(style_id).partition("/")
+        with self.lock:
+            return self.styles.get((category, filename))
+
+
+style_catalog = StyleCatalog(os.path.join(extension_path, "styles"))
+
+
+search_word_pattern = re.compile(r"\w+")
+search_cjk_pattern = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+
+
+def search_terms(text):
+    """lowercase word tokens, runs of CJK characters are split into overlapping bigrams"""
+    terms = []
+    for word in search_word_pattern.findall(str(text).lower()):
+        if len(word) > 1 and search_cjk_pattern.search(word):
+            terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            terms.append(word)
+    return terms
+
+
+def term_trigrams(term):
+    padded = f" {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# set bit positions of every byte value, for reading bitsets back out
+byte_bits = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+nonzero_byte_pattern = re.compile(rb"[^\x00]")
+
+
+class StyleSearchIndex:
+    """
+    Inverted index over name, description, prompt and negative prompt
+    query terms are expanded to indexed terms that match exactly, by prefix,
+    or by trigram similarity of the term itself, so small typos still hit
+    """
+
+    field_weights = {"name": 4.0, "description": 2.0, "prompt": 1.0, "negative": 0.25}
+    prefix_similarity = 0.8
+    fuzzy_threshold = 0.5
+    # queries with more level combinations than this rank by terms matched first instead
+    max_states = 512
+    # terms whose levels are kept between queries, typing a query repeats most of them
+    max_cached_levels = 256
+    # posting bitsets kept up to date across index changes
+    max_cached_postings = 4096
+
+    def __init__(self):
+        # term -> field weight -> style ids, queries turn them into int bitsets
+        # over self.order and combine those instead of touching single styles
+        self.postings = {}
+        self.documents = {}
+        self.order = {}
+        self.ids = []
+        self.categories = {}
+        self.trigrams = {}
+        self.vocabulary = []
+        self.vocabulary_dirty = False
+        self.expansions = {}
+        self.levels = {}
+        self.posting_bits = {}
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, style):
+        terms = {}
+        for field, weight in self.field_weights.items():
+            for term in search_terms(style.get(field, "")):
+                terms[term] = max(terms.get(term, 0.0), weight)
+        with self.lock:
+            self.remove(style["id"])
+            self.documents[style["id"]] = terms
+            if style["id"] not in self.order:
+                self.order[style["id"]] = len(self.ids)
+                self.ids.append(style["id"])
+            self.categories.setdefault(style["id"].split("/", 1)[0], set()).add(style["id"])
+            for term, weight in terms.items():
+                posting = self.postings.get(term)
+                if posting is None:
+                    posting = self.postings[term] = {}
+                    for trigram in term_trigrams(term):
+                        self.trigrams.setdefault(trigram, set()).add(term)
+                    self.vocabulary_dirty = True
+                posting.setdefault(weight, set()).add(style["id"])
+                bits = self.posting_bits.get((term, weight))
+                if bits is not None:
+                    self.posting_bits[(term, weight)] = bits | 1 << self.order[style["id"]]
+            self.expansions.clear()
+            self.levels.clear()
+
+    def remove(self, style_id):
+        with self.lock:
+            terms = self.documents.pop(style_id, None)
+            if terms is None:
+                return
+            self.categories[style_id.split("/", 1)[0]].discard(style_id)
+            for term, weight in terms.items():
+                posting = self.postings[term]
+                posting[weight].discard(style_id)
+                bits = self.posting_bits.get((term, weight))
+                if bits is not None:
+                    self.posting_bits[(term, weight)] = bits & ~(1 << self.order[style_id])
+                if not posting[weight]:
+                    del posting[weight]
+                    self.posting_bits.pop((term, weight), None)
+                if not posting:
+                    del self.postings[term]
+                    for trigram in term_trigrams(term):
+                        self.trigrams[trigram].discard(term)
+                    self.vocabulary_dirty = True
+            self.expansions.clear()
+            self.levels.clear()
+
+    def category_ids(self, category):
+        with self.lock:
+            return self.categories.get(category, set())
+
+    def update(self, catalog, diff):
+        with self.lock:
+            if not self.documents:
+                for style in catalog.entries():
+                    self.add(style)
+                self.warm()
+                return
+            for category, filename in diff.removed:
+                self.remove(category + "/" + filename)
+            for key in diff.added + diff.changed:
+                style = catalog.get(key[0] + "/" + key[1])
+                if style is not None:
+                    self.add(style)
+
+    def _expand(self, term):
+        expansion = self.expansions.get(term)
+        if expansion is not None:
+            return expansion
+        if self.vocabulary_dirty:
+            self.vocabulary = sorted(self.postings)
+            self.vocabulary_dirty = False
+        expansion = {}
+        start = bisect.bisect_left(self.vocabulary, term)
+        for candidate in itertools.islice(self.vocabulary, start, start + 200):
+            if not candidate.startswith(term):
+                break
+            expansion[candidate] = 1.0 if candidate == term else self.prefix_similarity
+        if len(term) >= 3:
+            grams = term_trigrams(term)
+            shared = {}
+            for trigram in grams:
+                for candidate in self.trigrams.get(trigram, ()):
+                    shared[candidate] = shared.get(candidate, 0) + 1
+            for candidate, count in shared.items():
+                similarity = 2.0 * count / (len(grams) + len(candidate))
+                if similarity >= self.fuzzy_threshold and similarity * self.prefix_similarity > expansion.get(candidate, 0.0):
+                    expansion[candidate] = similarity * self.prefix_similarity
+        self.expansions[term] = expansion
+        return expansion
+
+    def _bits(self, style_ids):
+        """style ids as an int with the bit of each one's position in self.order set"""
+        data = bytearray(len(self.ids) // 8 + 1)
+        order = self.order
+        for style_id in style_ids:
+            position = order[style_id]
+            data[position >> 3] |= 1 << (position & 7)
+        return int.from_bytes(data, "little")
+
+    def _ids(self, bits, limit=None):
+        """style ids of the set bits, lowest position (first indexed) first"""
+        ids = []
+        data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+        for match in nonzero_byte_pattern.finditer(data):
+            index = match.start() * 8
+            for bit in byte_bits[data[match.start()]]:
+                ids.append(self.ids[index + bit])
+            if limit is not None and len(ids) >= limit:
+                return ids[:limit]
+        return ids
+
+    def _posting_bits(self, term, weight):
+        bits = self.posting_bits.get((term, weight))
+        if bits is None:
+            if len(self.posting_bits) >= self.max_cached_postings:
+                self.posting_bits.clear()
+            bits = self.posting_bits[(term, weight)] = self._bits(self.postings[term][weight])
+        return bits
+
+    def warm(self):
+        """build the bitsets of the common postings, the ones slow to build on a first query"""
+        with self.lock:
+            common = max(64, len(self.documents) // 64)
+            for term, posting in self.postings.items():
+                for weight, style_ids in posting.items():
+                    if len(style_ids) >= common:
+                        self._posting_bits(term, weight)
+
+    def _levels(self, term):
+        """
+        the styles matching term split by the score the term gives them, best
+        first as [(score, bits)], plus the bits of all of them
+        """
+        cached = self.levels.get(term)
+        if cached is not None:
+            return cached
+        by_score = {}
+        for candidate, similarity in self._expand(term).items():
+            for weight in self.postings[candidate]:
+                score = round(similarity * weight, 9)
+                by_score[score] = by_score.get(score, 0) | self._posting_bits(candidate, weight)
+        levels, seen = [], 0
+        for score in sorted(by_score, reverse=True):
+            # a style scores what its best expansion in its best field gives it
+            bits = by_score[score] & ~seen
+            if bits:
+                levels.append((score, bits))
+                seen |= bits
+        if len(self.levels) >= self.max_cached_levels:
+            self.levels.clear()
+        self.levels[term] = (levels, seen)
+        return levels, seen
+
+    def _rank(self, levels, candidates, limit=None):
+        """rank the styles in the candidates bits by scoring each of them"""
+        scores = {}
+        matched = {}
+        for term_levels, _ in levels:
+            for score, bits in term_levels:
+                for style_id in self._ids(bits & candidates):
+                    scores[style_id] = scores.get(style_id, 0.0) + score
+                    matched[style_id] = matched.get(style_id, 0) + 1
+        # styles matching every query term rank above partial matches
+        rank = lambda style_id: (-matched[style_id], -round(scores[style_id], 9), self.order[style_id])
+        if limit and limit < len(scores):
+            return heapq.nsmallest(limit, scores, key=rank)
+        return sorted(scores, key=rank)
+
+    def _rank_top(self, levels, limit, matches):
+        """
+        the best limit styles without scoring every match: a state picks one
+        level (or none) per term, all styles in a state rank the same, and
+        states are visited best first so the walk stops once limit styles
+        are found and no remaining state can beat them
+        """
+        def rank(state):
+            picked = [levels[term][0][level][0] for term, level in enumerate(state) if level < len(levels[term][0])]
+            return (-len(picked), -round(sum(picked), 9))
+
+        start = (0,) * len(levels)
+        heap = [(rank(start), start)]
+        queued = {start}
+        groups, found, last_rank = [], 0, None
+        while heap:
+            state_rank, state = heapq.heappop(heap)
+            if found >= limit and state_rank > last_rank:
+                break
+            if state_rank[0] < 0:
+                bits = matches
+                for term, level in enumerate(state):
+                    term_levels, term_bits = levels[term]
+                    bits &= term_levels[level][1] if level < len(term_levels) else ~term_bits
+                if bits:
+                    # different level picks can add up to the same score, those styles tie
+                    if state_rank == last_rank:
+                        groups[-1] |= bits
+                    else:
+                        groups.append(bits)
+                    found += bits.bit_count()
+                    last_rank = state_rank
+            for term, level in enumerate(state):
+                if level < len(levels[term][0]):
+                    successor = state[:term] + (level + 1,) + state[term + 1:]
+                    if successor not in queued:
+                        queued.add(successor)
+                        heapq.heappush(heap, (rank(successor), successor))
+        ranked = []
+        for bits in groups:
+            # bit positions follow self.order, so ties come out in library order
+            ranked.extend(self._ids(bits, limit - len(ranked)))
+            if len(ranked) >= limit:
+                break
+        return ranked
+
+    def _top_candidates(self, levels, limit, matches):
+        """bits of the styles in the best terms-matched tiers, enough of them to fill limit"""
+        # at_least[count]: the styles matching at least count of the query terms
+        at_least = [matches] + [0] * len(levels)
+        for _, term_bits in levels:
+            for count in range(len(levels), 0, -1):
+                at_least[count] |= at_least[count - 1] & term_bits
+        for count in range(len(levels), 0, -1):
+            if at_least[count].bit_count() >= limit:
+                return at_least[count]
+        return matches
+
+    def search(self, query, limit=None, within=None, exclude=frozenset()):
+        """
+        return (style ids ranked best first, number of matches), only styles in
+        within (every style when None) and not in exclude are considered
+        """
+        query_terms = list(dict.fromkeys(search_terms(query)))
+        if not query_terms:
+            return [], 0
+        with self.lock:
+            levels = [self._levels(term) for term in query_terms]
+            matches = 0
+            for _, term_bits in levels:
+                matches |= term_bits
+            if within is not None:
+                matches &= self._bits(within & self.order.keys())
+            if exclude:
+                matches &= ~self._bits(exclude & self.order.keys())
+            total = matches.bit_count()
+            if not limit or limit >= total:
+                return self._rank(levels, matches), total
+            if math.prod(len(term_levels) + 1 for term_levels, _ in levels) <= self.max_states:
+                return self._rank_top(levels, limit, matches), total
+            # many terms: only the styles matching the most of them can make the top
+            return self._rank(levels, self._top_candidates(levels, limit, matches), limit), total
+
+
+search_index = StyleSearchIndex()
+
+
+class CatalogChangeLog:
+    """
+    Bounded log of per-style catalog changes behind a version cursor
+    clients ask for everything after the version they last saw and get a
+    reset instead when that version has already been dropped from the log
+    """
+
+    def __init__(self, maxlen=2000):
+        self.version = 0
+        self.events = deque(maxlen=maxlen)
+        self.lock = threading.Lock()
+
+    def record(self, diff):
+        with self.lock:
+            for op, keys in (("add", diff.added), ("update", diff.changed), ("remove", diff.removed)):
+                for category, filename in keys:
+                    self.version += 1
+                    self.events.append((self.version, op, category + "/" + filename))
+            return self.version
+
+    def since(self, version):
+        """return (current version, {style id: last op}) or (current version, None) when a reset is needed"""
+        with self.lock:
+            if version > self.version or (self.events and version < self.events[0][0] - 1):
+                return self.version, None
+            changes = {}
+            for event_version, op, style_id in self.events:
+                if event_version > version:
+                    changes.pop(style_id, None)
+                    changes[style_id] = op
+            return self.version, changes
+
+
+catalog_changes = CatalogChangeLog()
+catalog_update_lock = threading.Lock()
+
+
+@lru_cache(maxsize=65536)
+def prompt_key(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+class PromptTable:
+    """
+    Deduplicated prompt texts keyed by a short content hash
+    cards only carry the keys, so a negative shared by hundreds of styles is
+    stored once and sent to the browser once per page instead of per card
+    """
+
+    def __init__(self):
+        self.texts = {}
+        self.lock = threading.Lock()
+
+    def update(self, catalog, diff):
+        with self.lock:
+            if self.texts and not diff.changed and not diff.removed:
+                texts = self.texts
+                styles = [style for style in map(catalog.styles.get, diff.added) if style is not None]
+            else:
+                # changes and removals can orphan texts, rebuild rather than refcount
+                texts = {}
+                styles = catalog.entries()
+            for style in styles:
+                texts[prompt_key(style["prompt"])] = style["prompt"]
+                texts[prompt_key(style["negative"])] = style["negative"]
+            self.texts = texts
+
+    def get(self, keys):
+        with self.lock:
+            return {key: self.texts[key] for key in keys if key in self.texts}
+
+
+prompt_table = PromptTable()
+
+
+def word_shingles(text, size=3):
+    words = search_word_pattern.findall((text or "").lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[start:start + size]) for start in range(len(words) - size + 1)}
+
+
+def style_shingles(style):
+    """(prompt shingles, negative shingles)"""
+    return word_shingles(style["prompt"]), word_shingles(style["negative"])
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def style_similarity(a, b):
+    """
+    (similarity, prompt similarity, negative similarity) of two styles' shingles
+    the lower of the two counts, so a shared boilerplate negative alone never
+    makes a duplicate; it is also never above the Jaccard of the tagged union
+    the signatures are built from, so LSH on the union does not miss pairs
+    """
+    prompt, negative = jaccard(a[0], b[0]), jaccard(a[1], b[1])
+    return min(prompt, negative), prompt, negative
+
+
+class DuplicateIndex:
+    """
+    MinHash signatures of every style's prompt + negative shingles, banded for LSH
+    signatures use one-permutation hashing with rotation densification, so a
+    style costs one hash per shingle, and only styles sharing a band are
+    compared, candidates are then scored with their exact Jaccard similarity
+    """
+
+    permutations = 64
+    bands = 16
+    # a band shared by more styles than this comes from boilerplate like
+    # "a painting depicting {prompt}", it is skipped and the other bands decide
+    max_bucket = 48
+
+    def __init__(self):
+        self.signatures = {}
+        self.dirty = None
+        self.reports = {}
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+
+    def invalidate(self, diff):
+        if not (diff.added or diff.changed or diff.removed):
+            # the polling watcher rescans every few seconds, mostly finding nothing
+            return
+        with self.lock:
+            if self.dirty is not None:
+                self.dirty.update(diff.added, diff.changed, diff.removed)
+            self.reports = {}
+
+    def signature(self, shingles):
+        k = self.permutations
+        empty = 1 << 64
+        bins = [empty] * k
+        for shingle in shingles:
+            # hash() is only stable within one process, signatures are never persisted
+            value, slot = divmod(hash(shingle) & 0xFFFFFFFFFFFFFFFF, k)
+            if value < bins[slot]:
+                bins[slot] = value
+        filled = [slot for slot in range(k) if bins[slot] != empty]
+        if not filled:
+            return None
+        # empty bins borrow the next filled bin to the right, offset by how far it is
+        signature = list(bins)
+        for slot in range(k):
+            if bins[slot] == empty:
+                distance = next(((other - slot) % k for other in filled if other > slot), filled[0] + k - slot)
+                signature[slot] = bins[(slot + distance) % k] + distance * (empty // k)
+        return tuple(signature)
+
+    def _refresh(self, catalog):
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+        if dirty is None:
+            self.signatures = {}
+            keys = list(catalog.styles)
+        else:
+            keys = dirty
+        for key in keys:
+            style = catalog.styles.get(key)
+            style_id = key[0] + "/" + key[1]
+            signature = None
+            if style:
+                prompt, negative = style_shingles(style)
+                signature = self.signature(itertools.chain(((0,) + shingle for shingle in prompt), ((1,) + shingle for shingle in negative)))
+            if signature is None:
+                self.signatures.pop(style_id, None)
+            else:
+                self.signatures[style_id] = signature
+
+    def clusters(self, catalog, threshold=0.85):
+        """
+        return clusters of near-duplicate styles, best kept style first
+        [{"keep": id, "similarity": lowest score in the cluster, "members": [{"id", "similarity", ...}]}]
+        """
+        with self.build_lock, metrics.span("duplicates"):
+            with self.lock:
+                cached = self.reports.get(threshold)
+            if cached is not None:
+                return cached
+            self._refresh(catalog)
+            rows = self.permutations // self.bands
+            parent = {}
+
+            def find(style_id):
+                while parent.get(style_id, style_id) != style_id:
+                    parent[style_id] = parent.get(parent[style_id], parent[style_id])
+                    style_id = parent[style_id]
+                return style_id
+
+            shingles = {}
+
+            def shingles_of(style_id):
+                if style_id not in shingles:
+                    # a style removed since the signatures were refreshed matches nothing
+                    style = catalog.get(style_id)
+                    shingles[style_id] = style_shingles(style) if style else ({None}, {None})
+                return shingles[style_id]
+
+            def union(a, b):
+                root = find(a)
+                parent[root] = root
+                parent[find(b)] = root
+
+            # styles with the same signature (exact copies, mostly) are settled against
+            # one representative here, so however many there are they put a single
+            # entry into each band instead of overflowing its buckets
+            identical = {}
+            for style_id, signature in self.signatures.items():
+                identical.setdefault(signature, []).append(style_id)
+            representatives = {}
+            for signature, members in identical.items():
+                first = members[0]
+                representatives[first] = signature
+                for style_id in members[1:]:
+                    if style_similarity(shingles_of(first), shingles_of(style_id))[0] >= threshold:
+                        union(first, style_id)
+                    else:
+                        representatives[style_id] = signature
+            checked = set()
+            for band in range(self.bands):
+                buckets = {}
+                for style_id, signature in representatives.items():
+                    buckets.setdefault(signature[band * rows:(band + 1) * rows], []).append(style_id)
+                for members in buckets.values():
+                    if len(members) > self.max_bucket:
+                        continue
+                    for a, b in itertools.combinations(members, 2):
+                        if (a, b) in checked or find(a) == find(b):
+                            continue
+                        checked.add((a, b))
+                        # the signature estimate of the union similarity is an upper
+                        # bound give or take sampling error, most pairs stop here
+                        estimate = sum(x == y for x, y in zip(self.signatures[a], self.signatures[b])) / self.permutations
+                        if estimate < threshold - 0.3:
+                            continue
+                        if style_similarity(shingles_of(a), shingles_of(b))[0] >= threshold:
+                            union(a, b)
+            groups = {}
+            for style_id in parent:
+                groups.setdefault(find(style_id), []).append(style_id)
+            report = []
+            for members in groups.values():
+                styles = [catalog.get(style_id) for style_id in members]
+                styles = [style for style in styles if style is not None]
+                if len(styles) < 2:
+                    continue
+                # keep the style that has a preview of its own and is not packed, then by id
+                styles.sort(key=lambda style: (not (style.get("preview_digest") or os.path.isfile(style["img"])), bool(style.get("bundle")), style["id"]))
+                keep = styles[0]
+                scored = []
+                for style in styles:
+                    similarity, prompt, negative = style_similarity(shingles_of(keep["id"]), shingles_of(style["id"]))
+                    scored.append({
+                        "id": style["id"],
+                        "similarity": round(similarity, 3),
+                        "prompt_similarity": round(prompt, 3),
+                        "negative_similarity": round(negative, 3),
+                    })
+                report.append({"keep": keep["id"], "similarity": min(member["similarity"] for member in scored[1:]), "members": scored})
+            report.sort(key=lambda cluster: (-len(cluster["members"]), -cluster["similarity"], cluster["keep"]))
+            with self.lock:
+                self.reports[threshold] = report
+            return report
+
+    def hidden(self, catalog, threshold=0.85):
+        """ids of every clustered style except the one that is kept"""
+        return frozenset(member["id"] for cluster in self.clusters(catalog, threshold) for member in cluster["members"][1:])
+
+
+duplicate_index = DuplicateIndex()
+duplicates_dir = os.path.join(extension_path, "cache", "duplicates")
+
+
+def hidden_duplicates():
+    if not settings.get("hide_duplicates"):
+        return frozenset()
+    return duplicate_index.hidden(style_catalog, settings.get("duplicate_threshold", 0.85))
+
+
+def preview_use_counts():
+    """how many catalog styles point at each preview file"""
+    return Counter(os.path.normpath(style["img"]) for style in style_catalog.entries())
+
+
+def own_preview(style, use_counts):
+    """
+    the preview is the style's own file: next to its json, with the same stem,
+    and no other style uses it, a copied style still points at the original's
+    """
+    img = os.path.normpath(style["img"])
+    return (os.path.isfile(img) and os.path.dirname(img) == os.path.dirname(os.path.normpath(style["path"]))
+            and os.path.splitext(os.path.basename(img))[0] == os.path.splitext(style["filename"])[0]
+            and use_counts[img] <= 1)
+
+
+def merge_duplicates(threshold=0.85, keep_ids=None):
+    """
+    move every non-kept style of the chosen clusters (all clusters when keep_ids
+    is empty) to cache/duplicates, favourites follow to the kept style
+    packed styles are left alone, they can only go by unpacking their bundle
+    runs on style_writer, the files move while the catalog is locked and what
+    was already moved is put back when a later move fails
+    """
+    keep_ids = set(keep_ids or ())
+    result = {"moved": [], "skipped": []}
+    undo, merged = [], []
+    with metrics.span("merge_duplicates"), catalog_update_lock:
+        use_counts = preview_use_counts()
+        try:
+            for cluster in duplicate_index.clusters(style_catalog, threshold):
+                if keep_ids and cluster["keep"] not in keep_ids:
+                    continue
+                for member in cluster["members"][1:]:
+                    style = style_catalog.get(member["id"])
+                    if style is None or style.get("bundle"):
+                        result["skipped"].append(member["id"])
+                        continue
+                    target_dir = os.path.join(duplicates_dir, style["category"])
+                    files = [(style["path"], os.path.join(target_dir, style["filename"]))]
+                    if own_preview(style, use_counts):
+                        files.append((style["img"], os.path.join(target_dir, os.path.basename(style["img"]))))
+                    for source, target in files:
+                        if not os.path.isdir(target_dir):
+                            os.makedirs(target_dir)
+                            undo.append(partial(os.rmdir, target_dir))
+                        os.replace(source, target)
+                        undo.append(partial(os.replace, target, source))
+                    merged.append((member["id"], cluster["keep"]))
+        except OSError as e:
+            for action in reversed(undo):
+                try:
+                    action()
+                except OSError as undo_error:
+                    print(f"Stylez: could not undo duplicate merge step ({undo_error})")
+            metrics.inc("errors", kind="duplicate_merge")
+            raise OSError(f"duplicate merge failed, nothing was changed ({e})") from e
+    for style_id, keep_id in merged:
+        settings.replace_favourite(style_id, keep_id)
+        style_usage.rename(style_id, keep_id)
+        result["moved"].append(style_id)
+    if merged:
+        update_catalog()
+    return result
+
+
+class DuplicateMergeRequest(BaseModel):
+    threshold: float = 0.85
+    keep: List[str] = []
+
+
+class StyleUsage:
+    """
+    How often and how recently each style was applied, per user like favourites
+    the frequency decays with a half-life and is kept as log2 of its value at a
+    fixed epoch so a use is one O(1) update, the file is written behind in batches
+    """
+
+    def __init__(self, path, half_life_days=14.0, flush_delay=5.0):
+        self.path = path
+        self.half_life = half_life_days * 86400
+        self.flush_delay = flush_delay
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.timer = None
+        # user -> style id -> [log2 decayed count, last use, uses]
+        self.users = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for user, styles in data.get("users", {}).items():
+                self.users[user or None] = {style_id: list(entry) for style_id, entry in styles.items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            print(f"Stylez: could not read {path}, starting without usage history ({e})")
+
+    @staticmethod
+    def add_log2(a, b):
+        high, low = max(a, b), min(a, b)
+        return high + math.log2(1 + 2 ** (low - high))
+
+    def record(self, style_ids, user=None, now=None):
+        now = time.time() if now is None else now
+        # 2^(now/half_life) is the weight of a use at the epoch, older uses shrink against it
+        weight = now / self.half_life
+        with self.lock:
+            styles = self.users.setdefault(user or None, {})
+            for style_id in style_ids:
+                entry = styles.get(style_id)
+                if entry is None:
+                    styles[style_id] = [weight, now, 1]
+                else:
+                    entry[0] = self.add_log2(entry[0], weight)
+                    entry[1] = max(entry[1], now)
+                    entry[2] += 1
+            self.schedule_flush()
+        metrics.inc("style_uses", len(style_ids))
+
+    def rename(self, old_id, new_id):
+        """carry old_id's history over to new_id for every user, merging with what new_id has"""
+        with self.lock:
+            changed = False
+            for styles in self.users.values():
+                entry = styles.pop(old_id, None)
+                if entry is None:
+                    continue
+                current = styles.get(new_id)
+                if current is not None:
+                    entry = [self.add_log2(entry[0], current[0]), max(entry[1], current[1]), entry[2] + current[2]]
+                styles[new_id] = entry
+                changed = True
+            if changed:
+                self.schedule_flush()
+            return changed
+
+    def ranked(self, user=None, order="usage"):
+        """style ids used by user, most used (or most recent for order="recent") first"""
+        column = 1 if order == "recent" else 0
+        with self.lock:
+            styles = self.users.get(user or None, {})
+            return sorted(styles, key=lambda style_id: styles[style_id][column], reverse=True)
+
+    def order(self, styles, user=None, order="usage"):
+        """
+        styles reordered with the used ones first, the rest keep their order
+        costs one pass plus a sort of the used styles only
+        """
+        if order not in ("usage", "recent"):
+            return styles
+        rank = {style_id: position for position, style_id in enumerate(self.ranked(user, order))}
+        if not rank:
+            return styles
+        used = sorted((style for style in styles if style["id"] in rank), key=lambda style: rank[style["id"]])
+        return used + [style for style in styles if style["id"] not in rank]
+
+    def schedule_flush(self):
+        if self.timer is None:
+            self.timer = threading.Timer(self.flush_delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            data = {"users": {user or "": {style_id: list(entry) for style_id, entry in styles.items()} for user, styles in self.users.items()}}
+        with self.write_lock:
+            try:
+                write_file_atomic(self.path, json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            except OSError as e:
+                metrics.inc("errors", kind="usage_write")
+                print(f"Stylez: could not write {self.path} ({e})")
+
+
+style_usage = StyleUsage(style_usage_json)
+atexit.register(style_usage.flush)
+# card orders and their labels in the library tab
+card_orders = {"default": "默认排序", "usage": "常用优先", "recent": "最近使用"}
+
+
+class StyleUsageRequest(BaseModel):
+    styles: List[str]
+
+
+def update_catalog(full_scan=True):
+    # startup only validates directory mtimes against the snapshot; the
+    # refresh buttons stat every file so in-place edits are picked up too
+    with catalog_update_lock, metrics.span("catalog_update"):
+        old_dirs = style_catalog.dirs
+        diff = style_catalog.rescan(trust_dirs=not full_scan)
+        if diff.added or diff.changed or diff.removed or style_catalog.dirs != old_dirs or not os.path.exists(catalog_snapshot_json):
+            with metrics.span("snapshot_write"):
+                style_catalog.save_snapshot(catalog_snapshot_json)
+        with metrics.span("search_index_update"):
+            search_index.update(style_catalog, diff)
+        prompt_table.update(style_catalog, diff)
+        duplicate_index.invalidate(diff)
+        catalog_changes.record(diff)
+    return diff
+
+
+class StyleWatcher:
+    """
+    Keeps the catalog in sync with styles/ in the background
+    uses watchdog (inotify/FSEvents/ReadDirectoryChangesW) when it is
+    installed and otherwise polls: directory mtimes every tick, which catches
+    added and removed files, and every file every full_scan_ticks ticks, which
+    is the only way to see a json edited in place. bursts of changes are
+    debounced into a single rescan
+    """
+
+    def __init__(self, root, poll_interval=5.0, debounce=0.5, full_scan_ticks=6):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.full_scan_ticks = full_scan_ticks
+        self.ticks = 0
+        self.debounce = debounce
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        self.full_scan = False
+        self.observer = None
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+            handler = FileSystemEventHandler()
+            handler.on_any_event = lambda event: self.request_scan()
+            os.makedirs(self.root, exist_ok=True)
+            self.observer = Observer()
+            self.observer.schedule(handler, self.root, recursive=True)
+            self.observer.daemon = True
+            self.observer.start()
+        except Exception as e:
+            if not isinstance(e, ImportError):
+                print(f"Stylez: file watcher unavailable, polling instead ({e})")
+            self.observer = None
+        self.thread = threading.Thread(target=self._run, name="stylez-watcher", daemon=True)
+        self.thread.start()
+
+    def request_scan(self, full_scan=True):
+        with self.lock:
+            self.full_scan = self.full_scan or full_scan
+        self.wake.set()
+
+    def _run(self):
+        while True:
+            woke = self.wake.wait(None if self.observer else self.poll_interval)
+            if woke:
+                # wait for the burst to settle before scanning
+                while True:
+                    self.wake.clear()
+                    if not self.wake.wait(self.debounce):
+                        break
+            with self.lock:
+                full_scan, self.full_scan = self.full_scan, False
+            if not woke:
+                self.ticks += 1
+                if self.ticks % self.full_scan_ticks == 0:
+                    full_scan = True
+            try:
+                update_catalog(full_scan=full_scan)
+            except Exception as e:
+                print(f"Stylez: background rescan failed ({e})")
+
+
+style_watcher = StyleWatcher(style_catalog.root)
+
+
+class StylezStartup:
+    """
+    Everything the tab needs, built on a background thread once the app is up
+    stages run in order (CSV autoconvert, catalog, thumbnail warm-up) and their
+    progress is reported to the tab through /stylez/status
+    """
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.started = None
+        self.stage = "pending"
+        self.done = 0
+        self.total = 0
+        self.error = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.started = time.perf_counter()
+            self.thread = threading.Thread(target=self._run, name="stylez-startup", daemon=True)
+        self.thread.start()
+
+    def wait(self, timeout=60):
+        """block until the first catalog build is done, returns at once if no build was started"""
+        if self.thread is not None:
+            self.ready.wait(timeout)
+
+    def progress(self, stage, done=0, total=0):
+        with self.lock:
+            self.stage, self.done, self.total = stage, done, total
+
+    def status(self):
+        with self.lock:
+            return {
+                "ready": self.ready.is_set(),
+                "stage": self.stage,
+                "done": self.done,
+                "total": self.total,
+                "error": self.error,
+                "styles": len(style_catalog.styles),
+                "categories": style_catalog.categories,
+                "seconds": round(time.perf_counter() - self.started, 3) if self.started else 0,
+            }
+
+    def _run(self):
+        try:
+            with metrics.span("startup_autoconvert"):
+                self.progress("autoconvert")
+                run_autoconvert()
+            with metrics.span("startup_catalog"):
+                self.progress("catalog")
+                style_catalog.load_snapshot(catalog_snapshot_json)
+                update_catalog(full_scan=False)
+        except Exception as e:
+            self.error = str(e)
+            print(f"Stylez: background startup failed ({e})")
+        finally:
+            # waiters are released even after a failure, the refresh button still rescans
+            self.ready.set()
+        style_watcher.start()
+        with metrics.span("startup_thumbnails"):
+            self.warm_thumbnails()
+        self.progress("done")
+
+    def warm_thumbnails(self):
+        styles = style_catalog.entries()
+        self.progress("thumbnails", 0, len(styles))
+        for done, style in enumerate(styles, 1):
+            thumbnail_cache.lookup(style["img"] if os.path.isfile(style["img"]) else nopreview_path)
+            if done % 256 == 0:
+                self.progress("thumbnails", done - len(thumbnail_cache.pending), len(styles))
+        while thumbnail_cache.pending:
+            self.progress("thumbnails", len(styles) - len(thumbnail_cache.pending), len(styles))
+            time.sleep(0.5)
+
+
+startup = StylezStartup()
+
+
+def start_background_startup(demo, app):
+    startup.start()
+
+
+nopreview_path = os.path.join(extension_path, "nopreview.jpg")
+
+
+def card_data(style, favourites=frozenset()):
+    if style.get("preview_digest"):
+        # packed previews are served as they are, straight out of the bundle
+        img, src, srcset = style["img"], preview_url(style["preview_digest"]), ""
+    else:
+        img = style["img"] if os.path.isfile(style["img"]) else nopreview_path
+        thumb = thumbnail_cache.lookup(img)
+        if thumb:
+            src, srcset = preview_url(thumb, thumbnail_buckets()[0]), thumbnail_cache.srcset(thumb)
+        else:
+            # thumbnails not built yet, version the raw file by its own mtime
+            try:
+                version = os.stat(img).st_mtime_ns
+            except OSError:
+                version = 0
+            src, srcset = f"file={img}?v={version}", ""
+    return {
+        "id": style["id"],
+        "category": style["category"],
+        "filename": style["filename"],
+        "title": style["name"],
+        "description": style["description"],
+        "img": img.replace("\\", "/"),
+        "src": src,
+        "srcset": srcset,
+        "prompt_key": prompt_key(style["prompt"]),
+        "negative_key": prompt_key(style["negative"]),
+        "favourite": style["id"] in favourites,
+    }
+
+
+def card_prompts(styles):
+    """the prompt table entries the given cards refer to, each distinct text once"""
+    prompts = {}
+    for style in styles:
+        prompts[prompt_key(style["prompt"])] = style["prompt"]
+        prompts[prompt_key(style["negative"])] = style["negative"]
+    return prompts
+
+
+def filter_styles(styles, category, favourites=frozenset()):
+    if category == "Favourites":
+        return [style for style in styles if style["id"] in favourites]
+    if category and category != "All":
+        return [style for style in styles if style["category"] == category]
+    return styles
+
+
+def search_styles(query, category="All", limit=None, user=None, order="default"):
+    """return (matching styles ranked best first, number of matches)"""
+    within = None
+    if category == "Favourites":
+        within = settings.favourites_for(user)
+    elif category and category != "All":
+        within = search_index.category_ids(category)
+    exclude = hidden_duplicates()
+    if order in ("usage", "recent"):
+        # used styles go first, relevance decides among the rest so every match is needed
+        ids, total = search_index.search(query, None, within, exclude)
+    else:
+        ids, total = search_index.search(query, limit, within, exclude)
+    styles = [style_catalog.get(style_id) for style_id in ids]
+    styles = style_usage.order([style for style in styles if style is not None], user, order)
+    return styles[:limit] if limit else styles, total
+
+
+def list_cards(category="All", query="", page=0, size=120, user=None, order="default"):
+    size = max(1, min(size, 500))
+    page = max(0, page)
+    favourites = settings.favourites_for(user)
+    if query.strip():
+        styles, total = search_styles(query, category, (page + 1) * size, user, order)
+    else:
+        styles = filter_styles(style_catalog.entries(), category, favourites)
+        hidden = hidden_duplicates()
+        if hidden:
+            styles = [style for style in styles if style["id"] not in hidden]
+        styles = style_usage.order(styles, user, order)
+        total = len(styles)
+    styles = styles[page * size:(page + 1) * size]
+    with metrics.span("cards_render"):
+        cards = [card_data(style, favourites) for style in styles]
+    return {"total": total, "page": page, "size": size, "cards": cards, "prompts": card_prompts(styles), "version": catalog_changes.version}
+
+
+def list_changes(since, user=None):
+    version, changes = catalog_changes.since(since)
+    result = {"version": version, "reset": changes is None, "changes": [], "categories": style_catalog.categories}
+    favourites = settings.favourites_for(user)
+    styles = []
+    for style_id, op in (changes or {}).items():
+        style = style_catalog.get(style_id)
+        if op == "remove" or style is None:
+            result["changes"].append({"op": "remove", "id": style_id})
+        else:
+            styles.append(style)
+            result["changes"].append({"op": op, "id": style_id, "card": card_data(style, favourites)})
+    result["prompts"] = card_prompts(styles)
+    return result
+
+
+card_grid_renders = itertools.count(1)
+
+
+def card_grid_html():
+    # cards are fetched page by page from /stylez/cards by the grid in Stylez.js,
+    # data-render changes on every refresh so the client notices and reloads,
+    # data-loading makes it show a skeleton and poll /stylez/status instead,
+    # data-categories tells it whether the dropdowns are stale once ready
+    loading = "" if startup.ready.is_set() else ' data-loading="1"'
+    order = settings.get("card_order", "default")
+    categories = html.escape("\n".join(style_catalog.categories))
+    style_html = f"""<div id="style_cards_grid" data-card-size="{card_size_value}" data-order="{order}" data-categories="{categories}" data-render="{next(card_grid_renders)}"{loading}></div>"""
+    return style_html, ["All","Favourites"] + style_catalog.categories, list(style_catalog.categories)
+
+
+def generate_html_code(full_scan=True):
+    with metrics.profile("refresh"), metrics.span("refresh"):
+        update_catalog(full_scan)
+    return card_grid_html()
+
+CompiledStyle = namedtuple("CompiledStyle", ["text", "head", "tail", "head_key", "tail_key", "placeholder"])
+
+
+@lru_cache(maxsize=65536)
+def compile_style_prompt(text):
+    """split a style prompt around {prompt} once, the stripped halves are used to detect an applied style"""
+    text = text or ""
+    if "{prompt}" not in text:
+        return CompiledStyle(text, "", "", "", "", False)
+    head, _, tail = text.partition("{prompt}")
+    return CompiledStyle(text, head, tail, head.strip(), tail.strip(), True)
+
+
+def apply_compiled_style(prompt, compiled):
+    # same rules as applyStyle/appendStyle in Stylez.js, except that a style
+    # which is already present is left alone instead of being toggled off
+    if not compiled.text:
+        return prompt
+    if compiled.placeholder:
+        if (compiled.head_key or compiled.tail_key) and compiled.head_key in prompt and compiled.tail_key in prompt:
+            return prompt
+        return compiled.head + prompt + compiled.tail
+    if compiled.text in prompt:
+        return prompt
+    return compiled.text if prompt == "" else prompt + ", " + compiled.text
+
+
+def compile_styles(style_ids):
+    startup.wait()
+    compiled, missing = [], []
+    for style_id in style_ids:
+        style = style_catalog.get(style_id)
+        if style is None:
+            missing.append(style_id)
+            continue
+        compiled.append((compile_style_prompt(style["prompt"]), compile_style_prompt(style["negative"])))
+    if missing:
+        raise KeyError(", ".join(missing))
+    return compiled
+
+
+def compose_prompts(style_ids, prompts, negative_prompts=None):
+    """apply the styles, in order, to every prompt / negative prompt pair"""
+    compiled = compile_styles(style_ids)
+    negative_prompts = list(negative_prompts or [])
+    if len(negative_prompts) == 1:
+        negative_prompts = negative_prompts * len(prompts)
+    negative_prompts += [""] * (len(prompts) - len(negative_prompts))
+    styled_prompts, styled_negatives = [], []
+    for prompt, negative in zip(prompts, negative_prompts):
+        for positive_style, negative_style in compiled:
+            prompt = apply_compiled_style(prompt, positive_style)
+            negative = apply_compiled_style(negative, negative_style)
+        styled_prompts.append(prompt)
+        styled_negatives.append(negative)
+    return styled_prompts, styled_negatives
+
+
+def parse_style_ids(value):
+    if isinstance(value, str):
+        value = re.split(r"[\n,]", value)
+    return [str(style_id).strip() for style_id in value or [] if str(style_id).strip()]
+
+
+class StyleApplyRequest(BaseModel):
+    styles: List[str]
+    prompts: List[str] = []
+    negative_prompts: List[str] = []
+
+
+class StylezScript(scripts.Script):
+    def title(self):
+        return "Stylez"
+
+    def show(self, is_img2img):
+        return scripts.AlwaysVisible
+
+    def ui(self, is_img2img):
+        with gr.Accordion("Stylez", open=False):
+            style_ids = gr.Textbox(label="生成时应用的风格ID（每行一个，如 Styles/Q版2D.json）", lines=2, elem_id=self.elem_id("stylez_style_ids"))
+        return [style_ids]
+
+    def process(self, p, style_ids):
+        style_ids = parse_style_ids(style_ids)
+        if not style_ids:
+            return
+        try:
+            p.all_prompts, p.all_negative_prompts = compose_prompts(style_ids, p.all_prompts, p.all_negative_prompts)
+            # txt2img hires fix keeps its own prompt lists, filled in setup_prompts
+            if getattr(p, "enable_hr", False) and getattr(p, "all_hr_prompts", None):
+                p.all_hr_prompts, p.all_hr_negative_prompts = compose_prompts(style_ids, p.all_hr_prompts, getattr(p, "all_hr_negative_prompts", None))
+        except KeyError as e:
+            print(f"Stylez: unknown styles {e}")
+            return
+        p.extra_generation_params["Stylez"] = ", ".join(style_ids)
+        style_usage.record(style_ids, getattr(p, "user", None))
+
+
+sweep_progress_dir = os.path.join(extension_path, "cache", "sweeps")
+SweepJob = namedtuple("SweepJob", ["prompt", "style_id", "styled_prompt", "negative_prompt"])
+
+
+def expand_sweep_styles(entries):
+    """style ids pass through, a bare category name expands to every style in it"""
+    style_ids = []
+    for entry in parse_style_ids(entries):
+        if style_catalog.get(entry) is not None:
+            style_ids.append(entry)
+        else:
+            style_ids.extend(style["id"] for style in style_catalog.entries() if style["category"] == entry)
+    return list(dict.fromkeys(style_ids))
+
+
+def plan_sweep(prompts, style_ids, negative_prompt, width, height, max_batch_size):
+    """
+    expand the prompt x style matrix and group jobs sharing negative prompt and
+    resolution into batches of at most max_batch_size, in matrix order
+    returns a list of ((negative_prompt, width, height), [SweepJob, ...])
+    """
+    compiled = dict(zip(style_ids, compile_styles(style_ids)))
+    groups = {}
+    for prompt in prompts:
+        for style_id in style_ids:
+            positive_style, negative_style = compiled[style_id]
+            job = SweepJob(prompt, style_id, apply_compiled_style(prompt, positive_style), apply_compiled_style(negative_prompt, negative_style))
+            groups.setdefault((job.negative_prompt, width, height), []).append(job)
+    max_batch_size = max(1, int(max_batch_size))
+    return [(key, jobs[i:i + max_batch_size]) for key, jobs in groups.items() for i in range(0, len(jobs), max_batch_size)]
+
+
+def run_sweep(p, batches, seed, process_images=processing.process_images, resume=True):
+    """
+    run the batches in order, recording finished batches under a digest of the plan
+    a resumed sweep reuses the seed saved with its progress, so a random seed (-1)
+    still continues the same sweep. returns (images, infotexts, processed, seed)
+    """
+    plan = [[key, [job.styled_prompt for job in jobs]] for key, jobs in batches]
+    plan_digest = hashlib.sha1(json.dumps(plan, ensure_ascii=False).encode("utf-8")).hexdigest()
+    progress_path = os.path.join(sweep_progress_dir, plan_digest + ".json")
+    done = set()
+    if resume:
+        try:
+            with open(progress_path, "r", encoding="utf-8") as f:
+                progress = json.load(f)
+            done, seed = set(progress["done"]), progress["seed"]
+        except (OSError, ValueError, KeyError, TypeError):
+            done = set()
+    if done:
+        print(f"Stylez sweep: resuming with seed {seed}, {len(done)}/{len(batches)} batches already done")
+    os.makedirs(sweep_progress_dir, exist_ok=True)
+    shared.state.job_count = len(batches) - len(done)
+    images, infotexts, processed = [], [], None
+    for index, ((negative_prompt, width, height), jobs) in enumerate(batches):
+        if index in done:
+            continue
+        if shared.state.interrupted:
+            break
+        batch_p = copy.copy(p)
+        batch_p.prompt = [job.styled_prompt for job in jobs]
+        batch_p.negative_prompt = negative_prompt
+        batch_p.width, batch_p.height = width, height
+        batch_p.batch_size, batch_p.n_iter = len(jobs), 1
+        batch_p.seed = [seed] * len(jobs)
+        processed = process_images(batch_p)
+        images += processed.images
+        infotexts += processed.infotexts
+        done.add(index)
+        write_file_atomic(progress_path, json.dumps({"done": sorted(done), "total": len(batches), "seed": seed}).encode("utf-8"))
+    if len(done) == len(batches) and os.path.exists(progress_path):
+        os.remove(progress_path)
+    return images, infotexts, processed, seed
+
+
+class StylezSweepScript(scripts.Script):
+    def title(self):
+        return "Stylez sweep"
+
+    def ui(self, is_img2img):
+        sweep_styles = gr.Textbox(label="风格ID或风格大类（每行一个）", lines=4, elem_id=self.elem_id("stylez_sweep_styles"))
+        with gr.Row():
+            prompt_per_line = gr.Checkbox(value=False, label="每行提示词作为一个主题", elem_id=self.elem_id("stylez_sweep_prompt_per_line"))
+            resume = gr.Checkbox(value=True, label="继续未完成的任务", elem_id=self.elem_id("stylez_sweep_resume"))
+            max_batch_size = gr.Slider(minimum=1, maximum=64, step=1, value=8, label="最大批量", elem_id=self.elem_id("stylez_sweep_batch"))
+        return [sweep_styles, prompt_per_line, resume, max_batch_size]
+
+    def run(self, p, sweep_styles, prompt_per_line, resume, max_batch_size):
+        style_ids = expand_sweep_styles(sweep_styles)
+        if not style_ids:
+            raise ValueError("Stylez sweep: no styles selected")
+        prompts = [line for line in p.prompt.splitlines() if line.strip()] if prompt_per_line else [p.prompt]
+        batches = plan_sweep(prompts, style_ids, p.negative_prompt, p.width, p.height, max_batch_size)
+        seed = processing.get_fixed_seed(p.seed)
+        print(f"Stylez sweep: {len(prompts)} prompts x {len(style_ids)} styles in {len(batches)} batches")
+        images, infotexts, processed, seed = run_sweep(p, batches, seed, resume=resume)
+        if processed is None:
+            return processing.Processed(p, images, seed, "")
+        return processing.Processed(p, images, seed, infotexts[0] if infotexts else "", infotexts=infotexts)
+
+
+def encode_style_preview(img, size=200):
+    if img is None or img == "":
+        img = Image.open(nopreview_path)
+    with metrics.span("style_save_resize"):
+        img = img.convert("RGB").resize((size, size), Image.LANCZOS)
+    with metrics.span("style_save_encode"):
+        img_bytes = io.BytesIO()
+        img.save(img_bytes, format="JPEG")
+    return img_bytes.getvalue()
+
+
+def write_style(save_folder, filename, json_data, img):
+    save_folder_path = os.path.join(extension_path, "styles", save_folder)
+    os.makedirs(save_folder_path, exist_ok=True)
+    preview = encode_style_preview(img)
+    json_file_path = os.path.join(save_folder_path, filename + ".json")
+    img_path = os.path.join(save_folder_path, filename + ".jpg")
+    with metrics.span("style_save_write"):
+        # preview first, a rescan in between never sees a json pointing at a missing jpg
+        write_file_atomic(img_path, preview)
+        write_file_atomic(json_file_path, json.dumps(json_data, indent=4, ensure_ascii=False).encode("utf-8"))
+    metrics.inc("styles_saved")
+    print(f"""Saved: '{save_folder}/{filename}'""")
+    thumbnail_cache.submit(img_path)
+    style_watcher.request_scan()
+
+
+class StyleWriter:
+    """
+    One background thread that does every style write in submission order
+    the editor returns as soon as its job is queued, bulk edits queue behind
+    pending saves so they always see the files those saves produce
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.queued = 0
+
+    def submit(self, label, fn, *args):
+        with self.lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="stylez-writer")
+            self.queued += 1
+            metrics.set("writer_queue", self.queued)
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(partial(self._done, label))
+        return future
+
+    def _done(self, label, future):
+        with self.lock:
+            self.queued -= 1
+            metrics.set("writer_queue", self.queued)
+        error = future.exception()
+        if error is not None:
+            metrics.inc("errors", kind="style_write")
+            print(f"Stylez: {label} failed ({error})")
+
+
+# concurrent.futures joins its workers at exit, so queued saves still finish
+style_writer = StyleWriter()
+
+# bulk operations and their labels in the library tab
+bulk_operations = {"move": "移动到分类", "rename": "批量重命名", "delete": "删除所选"}
+deleted_dir = os.path.join(extension_path, "cache", "deleted")
+
+
+def plan_bulk_edit(op, style_ids, category="", template="{name}"):
+    """
+    (style, [(source, target)], new preview field or None) for every style that can be
+    edited plus the skipped ids, raises ValueError before anything is touched when
+    two styles would end up at the same path or a target is already taken
+    """
+    if op not in bulk_operations:
+        raise ValueError(f"unknown operation: {op!r}")
+    if op == "move":
+        target_dir = os.path.join(extension_path, "styles", check_category(category))
+    elif op == "rename" and "{name}" not in template and "{n}" not in template:
+        raise ValueError("the rename template needs {name} or {n}, or every style would get the same name")
+    plans, skipped, taken = [], [], set()
+    use_counts = preview_use_counts()
+    for style_id in dict.fromkeys(style_ids):
+        style = style_catalog.get(style_id)
+        if style is None or style.get("bundle"):
+            # packed styles only change by unpacking their bundle
+            skipped.append(style_id)
+            continue
+        source_dir = os.path.dirname(style["path"])
+        stem = os.path.splitext(style["filename"])[0]
+        preview_ext = os.path.splitext(style["img"])[1]
+        owned = own_preview(style, use_counts)
+        if op == "delete":
+            target_dir, new_stem = os.path.join(deleted_dir, style["category"]), stem
+        elif op == "rename":
+            target_dir = source_dir
+            new_stem = replace_illegal_filename_characters(template.replace("{name}", stem).replace("{n}", str(len(plans) + 1)))
+        else:
+            new_stem = stem
+        files = [(style["path"], os.path.join(target_dir, new_stem + ".json"))]
+        if owned:
+            files.append((style["img"], os.path.join(target_dir, new_stem + preview_ext)))
+        if files[0][0] == files[0][1]:
+            skipped.append(style_id)
+            continue
+        if op != "delete":
+            for _, target in files:
+                if target in taken or os.path.exists(target):
+                    raise ValueError(f"{os.path.relpath(target, extension_path)} already exists")
+                taken.add(target)
+        if owned:
+            preview = new_stem + preview_ext
+        elif op == "move" and os.path.isfile(style["img"]):
+            # previews shared with other styles stay where they are and are referenced from the new folder
+            preview = os.path.relpath(style["img"], target_dir).replace("\\", "/")
+        else:
+            preview = None
+        plans.append((style, files, preview))
+    return plans, skipped
+
+
+def bulk_edit_styles(op, style_ids, category="", template="{name}"):
+    """
+    move, rename or delete many styles as one transaction: all files are moved
+    while the catalog is locked, what was already moved is put back when a later
+    move fails, and the catalog is rescanned once at the end
+    """
+    plans, skipped = plan_bulk_edit(op, style_ids, category, template)
+    result = {"op": op, "done": [], "skipped": skipped}
+    if not plans:
+        return result
+    undo = []
+    trash = os.path.join(deleted_dir, str(time.time_ns()))
+    with metrics.span("bulk_edit"), catalog_update_lock:
+        try:
+            for style, files, preview in plans:
+                for source, target in files:
+                    if op == "delete":
+                        target = os.path.join(trash, os.path.relpath(target, deleted_dir))
+                    if not os.path.isdir(os.path.dirname(target)):
+                        os.makedirs(os.path.dirname(target))
+                        undo.append(partial(os.rmdir, os.path.dirname(target)))
+                    os.replace(source, target)
+                    undo.append(partial(os.replace, target, source))
+                if preview is not None and preview != style["preview"]:
+                    json_path = files[0][1]
+                    with open(json_path, "rb") as f:
+                        original = f.read()
+                    style_json = json.loads(original)
+                    style_json["preview"] = preview
+                    write_file_atomic(json_path, json.dumps(style_json, indent=4, ensure_ascii=False).encode("utf-8"))
+                    undo.append(partial(write_file_atomic, json_path, original))
+        except (OSError, ValueError) as e:
+            for action in reversed(undo):
+                try:
+                    action()
+                except OSError as undo_error:
+                    print(f"Stylez: could not undo bulk {op} step ({undo_error})")
+            metrics.inc("errors", kind="bulk_edit")
+            raise OSError(f"bulk {op} failed, nothing was changed ({e})") from e
+        finally:
+            shutil.rmtree(trash, ignore_errors=True)
+    for style, files, preview in plans:
+        if op != "delete":
+            # ids are "<folder name>/<file name>", the same as the catalog builds them
+            new_id = os.path.basename(os.path.dirname(files[0][1])) + "/" + os.path.basename(files[0][1])
+            settings.replace_favourite(style["id"], new_id)
+            style_usage.rename(style["id"], new_id)
+        result["done"].append(style["id"])
+    metrics.inc("bulk_edits", len(result["done"]), op=op)
+    update_catalog()
+    return result
+
+
+class BulkEditRequest(BaseModel):
+    op: str
+    styles: List[str]
+    category: str = ""
+    template: str = "{name}"
+
 
 def refresh_styles(cat):
     if cat is None or len(cat) == 0 or cat  == "[]" :
@@ -239,14 +2701,7 @@ def refresh_styles(cat):
     return newhtml_sendback,gr.update(choices=newcat_sendback),gr.update(value="All"),gr.update(choices=newfilecat_sendback)
 
 def save_style(title, img, description, prompt, prompt_negative, filename, save_folder):
-    print(f"""Saved: '{save_folder}/{filename}'""")
     if save_folder and filename:
-        if img is None or img == "":
-            img = Image.open(os.path.join(extension_path, "nopreview.jpg")) 
-        img = img.resize((200, 200))
-        save_folder_path = os.path.join(extension_path, "styles", save_folder)
-        if not os.path.exists(save_folder_path):
-            os.makedirs(save_folder_path)
         json_data = {
             "name": title,
             "description": description,
@@ -254,16 +2709,12 @@ def save_style(title, img, description, prompt, prompt_negative, filename, save_
             "prompt": prompt,
             "negative": prompt_negative,
         }
-        json_file_path = os.path.join(save_folder_path, filename + ".json")
-        with open(json_file_path, "w") as json_file:
-            json.dump(json_data, json_file, indent=4)
-        img_path = os.path.join(save_folder_path, filename + ".jpg")
-        img.save(img_path)
-        msg = f"""File Saved to '{save_folder}'"""
-        info(msg)
-    else:
-        msg = """Please provide a valid save folder and Filename"""
-        warning(msg)
+        # resize, encode and write happen on the writer thread, the editor is free again at once
+        style_writer.submit(f"saving '{save_folder}/{filename}'", write_style, save_folder, filename, json_data, img)
+        info(f"""Saving to '{save_folder}'""")
+        return gr.update(value=f"""<p id="style_filename_check" style="color:green;">正在保存到 '{html.escape(save_folder)}'</p>""")
+    msg = """Please provide a valid save folder and Filename"""
+    warning(msg)
     return filename_check(save_folder,filename)
 
 def info(message):
@@ -291,48 +2742,106 @@ def clear_style():
     previewimage = os.path.join(extension_path, "nopreview.jpg")
     return gr.update(value=None),gr.update(value=previewimage),gr.update(value=None),gr.update(value=None),gr.update(value=None),gr.update(value=None),gr.update(value=None)
 
-def deletestyle(folder, filename):
+def delete_style_files(folder, filename):
+    """
+    remove a style's json and its own preview, queued on style_writer so it
+    runs after any pending save of the same style
+    returns "deleted", "packed" or "missing"
+    """
     base_path = os.path.join(extension_path, "styles", folder)
     json_file_path = os.path.join(base_path, filename + ".json")
-    jpg_file_path = os.path.join(base_path, filename + ".jpg")
-
-    if os.path.exists(json_file_path):
+    jpg_file_path = os.path.normpath(os.path.join(base_path, filename + ".jpg"))
+    style = style_catalog.get(f"{folder}/{filename}.json")
+    if not os.path.exists(json_file_path):
+        return "packed" if (style or {}).get("bundle") else "missing"
+    with catalog_update_lock:
+        # a copied style may still point at this preview
+        own = style is not None and os.path.normpath(style["img"]) == jpg_file_path
+        shared_preview = preview_use_counts()[jpg_file_path] > own
         os.remove(json_file_path)
-        warning(f"""Stlye "{filename}" deleted!! """)
-        if os.path.exists(jpg_file_path):
+        # styles imported from csv have no preview of their own
+        if os.path.exists(jpg_file_path) and not shared_preview:
             os.remove(jpg_file_path)
-        else:
-            warning(f"Error: {jpg_file_path} not found.")
+    style_watcher.request_scan()
+    return "deleted"
+
+
+def deletestyle(folder, filename):
+    try:
+        outcome = style_writer.submit(f"delete {filename}", delete_style_files, folder, filename).result()
+    except OSError as e:
+        warning(f"Error: could not delete {filename} ({e})")
+        return
+    if outcome == "deleted":
+        warning(f"""Stlye "{filename}" deleted!! """)
+    elif outcome == "packed":
+        warning(f"Error: {filename} is packed in {folder}{bundle_extension}, unpack it to delete single styles.")
     else:
-        warning(f"Error: {json_file_path} not found.")
-
-def addToFavourite(style):
- global favourites
- if (style not in favourites):
-     favourites.append(style)
-     save_settings("favourites",favourites)
-     info("style added to favourites")
-
-def removeFavourite(style):
- global favourites
- if (style in favourites):
-     favourites.remove(style)
-     save_settings("favourites",favourites)
-     info("style removed from favourites")
+        warning(f"Error: {os.path.join(extension_path, 'styles', folder, filename + '.json')} not found.")
+
+def addToFavourite(style, request: gr.Request):
+    if settings.add_favourite(style, getattr(request, "username", None)):
+        info("style added to favourites")
+
+def removeFavourite(style, request: gr.Request):
+    if settings.remove_favourite(style, getattr(request, "username", None)):
+        info("style removed from favourites")
 
 def oldstyles(value):
-    with open(config_json, "r") as json_file:
-        data = json.load(json_file)
-        if (data["hide_old_styles"] == True):
-            save_settings("hide_old_styles",False)
-        else:
-            save_settings("hide_old_styles",True)
+    save_settings("hide_old_styles", bool(value))
 
-def create_ar_button(label, width, height, button_class="ar-button"):
-    return gr.Button(label, elem_classes=button_class).click(fn=None, _js=f'sendToARbox({width}, {height})')
+def hide_duplicates(value):
+    save_settings("hide_duplicates", bool(value))
+
+def card_order(label):
+    order = next((order for order, order_label in card_orders.items() if order_label == label), "default")
+    save_settings("card_order", order)
+
+def bulk_edit(label, category, template, style_ids):
+    op = next((op for op, op_label in bulk_operations.items() if op_label == label), None)
+    style_ids = parse_style_ids(style_ids)
+    if op is None or not style_ids:
+        warning("请先选择要批量处理的风格卡片")
+        return
+    try:
+        # queued behind pending saves, the result is waited for so it can be reported
+        result = style_writer.submit(f"bulk {op}", bulk_edit_styles, op, style_ids, category, template or "{name}").result()
+    except (OSError, ValueError) as e:
+        warning(f"Error: {e}")
+        return
+    msg = f"{label}: {len(result['done'])} styles"
+    if result["skipped"]:
+        msg += f", {len(result['skipped'])} skipped (packed or unchanged)"
+    info(msg)
+
+def resolution_panel_html(presets):
+    """size preset buttons and the nearest size calculator as one block, clicks are handled in Stylez.js"""
+    parts = ['<div id="stylez_resolution_panel">']
+    for group in presets:
+        parts.append(f'<p class="stylez_preset_title">{html.escape(str(group.get("title", "")))}</p>')
+        for row in group.get("rows", []):
+            buttons = []
+            for preset in row:
+                try:
+                    width, height, ratio = int(preset[0]), int(preset[1]), str(preset[2])
+                except (TypeError, ValueError, IndexError):
+                    print(f"Stylez: skipping malformed resolution preset {preset!r}")
+                    continue
+                button_class = "ar2-button" if len(preset) > 3 and preset[3] else "ar-button"
+                buttons.append(f'<button class="stylez_preset {button_class}" data-width="{width}" data-height="{height}">{width}×{height} | {html.escape(ratio)}</button>')
+            parts.append(f'<div class="stylez_preset_row">{"".join(buttons)}</div>')
+    parts.append("""<p class="stylez_preset_title">最近尺寸（64的倍数）:</p>
+<div class="stylez_preset_row stylez_bucket_calc">
+<input class="stylez_bucket_ratio" type="text" value="16:9" placeholder="宽高比，如 16:9 或 2.39" title="宽高比">
+<input class="stylez_bucket_megapixels" type="number" value="1.05" min="0.1" max="16" step="0.05" title="百万像素">
+<select class="stylez_bucket_model" title="模型"><option value="1.05">SDXL</option><option value="0.26">SD1.5</option></select>
+<button class="stylez_preset ar2-button stylez_bucket_result" data-width="1344" data-height="768">1344×768</button>
+</div></div>""")
+    return "".join(parts)
 
 def add_tab():
-    generate_styles_and_tags = generate_html_code()
+    # no scan here, the catalog is built by the startup worker and the grid fills in when it is ready
+    generate_styles_and_tags = card_grid_html()
     nopreview = os.path.join(extension_path, "nopreview.jpg")
     global hideoldstyles
     with gr.Blocks(analytics_enabled=False,) as ui:
@@ -352,16 +2861,28 @@ def add_tab():
                         with gr.Row(elem_id="style_search_search"):
                             Style_Search = gr.Textbox('', label="搜索框", elem_id="style_search", placeholder="搜索...", elem_classes="textbox", lines=1,scale=3)
                             category_dropdown = gr.Dropdown(label="风格大类", choices=generate_styles_and_tags[1], value="All", elem_id="style_Catagory", elem_classes="dropdown styles_dropdown",scale=1)
+                            order_dropdown = gr.Dropdown(label="排序", choices=list(card_orders.values()), value=card_orders.get(settings.get("card_order"), card_orders["default"]), elem_id="style_order", elem_classes="dropdown styles_dropdown",scale=1)
+                            setattr(order_dropdown,"do_not_save_to_config",True)
                             refresh_button = gr.Button(refresh_symbol, elem_id="style_refresh", elem_classes="tool")
                         with gr.Row():
                             with gr.Column(elem_id="style_cards_column"):
                                 Styles_html=gr.HTML(generate_styles_and_tags[0])
+                        with gr.Row(elem_id="style_bulk_row"):
+                            bulk_op_dropdown = gr.Dropdown(label="批量操作", choices=list(bulk_operations.values()), value=bulk_operations["move"], elem_id="style_bulk_op", elem_classes="dropdown styles_dropdown",scale=1)
+                            bulk_category_dropdown = gr.Dropdown(label="目标分类", choices=generate_styles_and_tags[2], value="Styles", elem_id="style_bulk_category", elem_classes="dropdown styles_dropdown",allow_custom_value=True,scale=1)
+                            bulk_template_txt = gr.Textbox("{name}", label="新文件名（{name} 原名，{n} 序号）", elem_id="style_bulk_template", lines=1,scale=2)
+                            bulk_ids_txt = gr.Textbox(elem_id="style_bulk_ids",visible=False)
+                            bulk_apply_btn = gr.Button("应用到所选", elem_id="style_bulk_apply")
+                            for component in (bulk_op_dropdown, bulk_category_dropdown, bulk_template_txt):
+                                setattr(component,"do_not_save_to_config",True)
                 with gr.Row(elem_id="stylesPreviewRow"):
                     gr.Checkbox(value=True,label="应用/移除正向词", elem_id="styles_apply_prompt", elem_classes="styles_checkbox checkbox")
                     gr.Checkbox(value=True,label="应用/移除负向词", elem_id="styles_apply_neg", elem_classes="styles_checkbox checkbox")
                     gr.Checkbox(value=True,label="悬停预览", elem_id="HoverOverStyle_preview", elem_classes="styles_checkbox checkbox")
                     oldstylesCB = gr.Checkbox(value=hideoldstyles,label="隐藏原始样式栏", elem_id="hide_default_styles", elem_classes="styles_checkbox checkbox", interactive=True)
                     setattr(oldstylesCB,"do_not_save_to_config",True)
+                    hide_duplicates_cb = gr.Checkbox(value=settings.get("hide_duplicates"),label="隐藏重复风格", elem_id="hide_duplicate_styles", elem_classes="styles_checkbox checkbox", interactive=True)
+                    setattr(hide_duplicates_cb,"do_not_save_to_config",True)
                     card_size_slider = gr.Slider(value=card_size_value,minimum=card_size_min,maximum=card_size_max,label="预览尺寸:", elem_id="card_thumb_size")
                     setattr(card_size_slider,"do_not_save_to_config",True)
                 with gr.Row(elem_id="stylesPreviewRow"):
@@ -399,80 +2920,8 @@ def add_tab():
             with gr.TabItem(label="尺寸设置", elem_id="Size settings"):
                 with gr.Row():
                     with gr.Column():
-                        gr.HTML("""<p style="color: #F36812; font-size: 14px; height: 14px; margin: -5px 0px;">宽度×高度（SDXL）:</p>""")
-                        with gr.Row():
-                            create_ar_button("1024×1024 | 1:1", 1024, 1024, button_class="ar2-button")
-                        with gr.Row():
-                            create_ar_button("576×1728 | 1:3", 576, 1728)
-                            create_ar_button("1728×576 | 3:1", 1728, 576)
-                            create_ar_button("576×1664 | 9:26", 576, 1664)
-                            create_ar_button("1664×576 | 26:9", 1664, 576)
-                        with gr.Row():
-                            create_ar_button("640×1600 | 2:5", 640, 1600)
-                            create_ar_button("1600×640 | 5:2", 1600, 640)
-                            create_ar_button("640×1536 | 5:12", 640, 1536)
-                            create_ar_button("1536×640 | 12:5", 1536, 640)
-                        with gr.Row():
-                            create_ar_button("704×1472 | 11:23", 704, 1472)
-                            create_ar_button("1472×704 | 23:11", 1472, 704)
-                            create_ar_button("704×1408 | 1:2", 704, 1408)
-                            create_ar_button("1408×704 | 2:1", 1408, 704)
-                        with gr.Row():
-                            create_ar_button("704×1344 | 11:21", 704, 1344)
-                            create_ar_button("1344×704 | 21:11", 1344, 704)
-                            create_ar_button("768×1344 | 4:7", 768, 1344)
-                            create_ar_button("1344×768 | 7:4", 1344, 768, button_class="ar2-button")
-                        with gr.Row():
-                            create_ar_button("768×1280 | 3:5", 768, 1280)
-                            create_ar_button("1280×768 | 5:3", 1280, 768)
-                            create_ar_button("832×1216 | 13:19", 832, 1216, button_class="ar2-button")
-                            create_ar_button("1216×832 | 19:13", 1216, 832)
-                        with gr.Row():
-                            create_ar_button("832×1152 | 13:18", 832, 1152)
-                            create_ar_button("1152×832 | 18:13", 1152, 832)
-                            create_ar_button("896×1152 | 7:9", 896, 1152)
-                            create_ar_button("1152×896 | 9:7", 1152, 896)
-                        with gr.Row():
-                            create_ar_button("896×1088 | 14:17", 896, 1088)
-                            create_ar_button("1088×896 | 17:14", 1088, 896)
-                            create_ar_button("960×1088 | 15:17", 960, 1088)
-                            create_ar_button("1088×960 | 17:15", 1088, 960)
-                        with gr.Row():
-                            create_ar_button("960×1024 | 15:16", 960, 1024)
-                            create_ar_button("1024×960 | 16:15", 1024, 960)
-                        gr.HTML("""<p style="color: #F36812; font-size: 14px; height: 14px; margin: -5px 0px;">宽度×高度（SD1.5）:</p>""")
-                        with gr.Row():
-                            create_ar_button("512×512 | 1:1", 512, 512, button_class="ar2-button")
-                            create_ar_button("768×768 | 1:1", 768, 768)
-                            create_ar_button("576×1024 | 9:16", 576, 1024)
-                            create_ar_button("1024×576 | 16:9", 1024, 576)
-                        with gr.Row():
-                            create_ar_button("512×768 | 2:3", 512, 768)
-                            create_ar_button("768×512 | 3:2", 768, 512)
-                            create_ar_button("576×768 | 3:4", 576, 768)
-                            create_ar_button("768×576 | 4:3", 768, 576)
-                        gr.HTML("""<p style="color: #F36812; font-size: 14px; height: 14px; margin: -5px 0px;">宽度×高度（Custom）近似:</p>""")
-                        with gr.Row():
-                            create_ar_button("880×1176 | 3:4", 880, 1176)
-                            create_ar_button("1176×880 | 4:3", 1176, 880)
-                            create_ar_button("768×1360 | 9:16", 768, 1360)
-                            create_ar_button("1360×768 | 16:9", 1360, 768)
-                        with gr.Row():
-                            create_ar_button("1576×656 | 2.39:1", 1576, 656)
-                            create_ar_button("1392×752 | 1.85:1", 1392, 752)
-                            create_ar_button("1176×888 | 1.33:1", 1176, 888)
-                            create_ar_button("1568×664 | 2.35:1", 1568, 664)
-                        with gr.Row():
-                            create_ar_button("1312×792 | 1.66:1", 1312, 792)
-                            create_ar_button("1224×856 | 1.43:1", 1224, 856)
-                            create_ar_button("912×1144 | 4:5", 912, 1144)
-                            create_ar_button("1296×800 | 1.618:1", 1296, 800)
-                        gr.HTML("""<p style="color: #F36812; font-size: 14px; height: 14px; margin: -5px 0px;">宽度×高度（Custom）强制:</p>""")
-                        with gr.Row():
-                            create_ar_button("720×1280 | 9:16", 720, 1280)
-                            create_ar_button("1280×720 | 16:9", 1280, 720)
-                            create_ar_button("800×1280 | 10:16", 800, 1280)
-                            create_ar_button("1280×800 | 16:10", 1280, 800)
+                        # one HTML block for every preset instead of a gradio button and event each
+                        gr.HTML(resolution_panel_html(settings.get("resolution_presets") or default_resolution_presets))
 
             with gr.TabItem(label="注意"):  # 新增的Tab标题           
                 gr.Markdown("""
@@ -487,11 +2936,14 @@ def add_tab():
                 </a>
                 """)
         oldstylesCB.change(fn=oldstyles,inputs=[oldstylesCB],_js="hideOldStyles")
+        hide_duplicates_cb.change(fn=hide_duplicates,inputs=[hide_duplicates_cb]).then(fn=None,_js="hideDuplicatesChange")
+        bulk_apply_btn.click(fn=bulk_edit,_js="stylezBulkArgs",inputs=[bulk_op_dropdown,bulk_category_dropdown,bulk_template_txt,bulk_ids_txt]).then(fn=None,_js="stylezBulkDone")
         refresh_button.click(fn=refresh_styles,inputs=[category_dropdown], outputs=[Styles_html,category_dropdown,category_dropdown,style_savefolder_txt])
         card_size_slider.release(fn=save_card_def,inputs=[card_size_slider])
         card_size_slider.change(fn=None,inputs=[card_size_slider],_js="cardSizeChange")
-        category_dropdown.change(fn=None,_js="filterSearch",inputs=[category_dropdown,Style_Search])
-        Style_Search.change(fn=None,_js="filterSearch",inputs=[category_dropdown,Style_Search])
+        category_dropdown.change(fn=None,_js="filterSearch",inputs=[category_dropdown,Style_Search,order_dropdown])
+        Style_Search.change(fn=None,_js="filterSearch",inputs=[category_dropdown,Style_Search,order_dropdown])
+        order_dropdown.change(fn=card_order,inputs=[order_dropdown]).then(fn=None,_js="filterSearch",inputs=[category_dropdown,Style_Search,order_dropdown])
         style_img_url_txt.change(fn=img_to_thumbnail, inputs=[style_img_url_txt],outputs=[thumbnailbox])
         style_grab_current_btn.click(fn=None,_js='grabCurrentSettings')
         style_lastgen_btn.click(fn=None,_js='grabLastGeneratedimage')
@@ -509,3 +2961,5 @@ def add_tab():
     return [(ui, "stylez_menutab", "stylez_menutab")]
 
 script_callbacks.on_ui_tabs(add_tab)
+script_callbacks.on_app_started(add_api_routes)
+script_callbacks.on_app_started(start_background_startup)
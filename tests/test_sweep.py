@@ -0,0 +1,121 @@
+"""
+CPU tests for the Stylez sweep runner
+
+Loads scripts/Stylez.py with the benchmark's stubbed `modules` and `gradio`
+packages and drives run_sweep with a stand-in process_images that records
+every batch instead of generating images.
+
+    python -m pytest tests
+"""
+import atexit
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+spec = importlib.util.spec_from_file_location("bench_stylez", os.path.join(repo_root, "benchmarks", "bench_stylez.py"))
+bench_stylez = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bench_stylez)
+
+
+class RecordingProcessImages:
+    """
+    stand-in for processing.process_images, returns the prompts as images
+    and can interrupt the sweep after a number of batches
+    """
+
+    def __init__(self, stylez, interrupt_after=None):
+        self.stylez = stylez
+        self.interrupt_after = interrupt_after
+        self.batches = []
+
+    def __call__(self, p):
+        self.batches.append(p)
+        if len(self.batches) == self.interrupt_after:
+            self.stylez.shared.state.interrupted = True
+        return types.SimpleNamespace(images=list(p.prompt), infotexts=[f"seed {seed}" for seed in p.seed])
+
+
+class SweepTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.extension_dir = tempfile.mkdtemp(prefix="stylez-test-")
+        bench_stylez.generate_library(cls.extension_dir, styles=12, categories=3, previews=False)
+        cls.stylez = bench_stylez.load_stylez(cls.extension_dir)
+        atexit.unregister(cls.stylez.settings.flush)
+        atexit.unregister(cls.stylez.style_usage.flush)
+        cls.stylez.update_catalog()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.extension_dir, ignore_errors=True)
+        sys.modules.pop("Stylez", None)
+
+    def setUp(self):
+        self.stylez.shared.state.interrupted = False
+        shutil.rmtree(self.stylez.sweep_progress_dir, ignore_errors=True)
+        self.style_ids = self.stylez.expand_sweep_styles("\n".join(f"Category {index:03d}" for index in range(3)))
+        self.prompts = ["a cat", "a lighthouse at dusk"]
+        self.batches = self.stylez.plan_sweep(self.prompts, self.style_ids, "lowres", 512, 768, 4)
+        self.p = types.SimpleNamespace(prompt="", negative_prompt="lowres", width=512, height=768, seed=-1)
+
+    def expected_prompts(self):
+        return [job.styled_prompt for _, jobs in self.batches for job in jobs]
+
+    def test_plan_covers_matrix_in_batches(self):
+        self.assertEqual(len(self.style_ids), 12)
+        self.assertEqual(sum(len(jobs) for _, jobs in self.batches), len(self.prompts) * len(self.style_ids))
+        for (negative_prompt, width, height), jobs in self.batches:
+            self.assertLessEqual(len(jobs), 4)
+            self.assertEqual((width, height), (512, 768))
+            self.assertTrue(all(job.negative_prompt == negative_prompt for job in jobs))
+        matrix = [(prompt, style_id) for prompt in self.prompts for style_id in self.style_ids]
+        for _, jobs in self.batches:
+            positions = [matrix.index((job.prompt, job.style_id)) for job in jobs]
+            self.assertEqual(positions, sorted(positions))
+
+    def test_runs_batches_in_order(self):
+        process_images = RecordingProcessImages(self.stylez)
+        images, infotexts, processed, seed = self.stylez.run_sweep(self.p, self.batches, 1234, process_images=process_images)
+        self.assertEqual(len(process_images.batches), len(self.batches))
+        for batch_p, ((negative_prompt, width, height), jobs) in zip(process_images.batches, self.batches):
+            self.assertEqual(batch_p.prompt, [job.styled_prompt for job in jobs])
+            self.assertEqual(batch_p.negative_prompt, negative_prompt)
+            self.assertEqual((batch_p.batch_size, batch_p.n_iter), (len(jobs), 1))
+            self.assertEqual(batch_p.seed, [1234] * len(jobs))
+        self.assertEqual(images, self.expected_prompts())
+        self.assertEqual(len(infotexts), len(images))
+        self.assertEqual(seed, 1234)
+        self.assertEqual(os.listdir(self.stylez.sweep_progress_dir), [])
+
+    def test_resume_reuses_saved_seed(self):
+        first = RecordingProcessImages(self.stylez, interrupt_after=2)
+        images, _, _, seed = self.stylez.run_sweep(self.p, self.batches, 1234, process_images=first)
+        self.assertEqual((len(first.batches), seed), (2, 1234))
+        self.assertEqual(len(os.listdir(self.stylez.sweep_progress_dir)), 1)
+
+        # a random seed draws a new value on every run, the resumed sweep must ignore it
+        self.stylez.shared.state.interrupted = False
+        second = RecordingProcessImages(self.stylez)
+        resumed_images, _, _, seed = self.stylez.run_sweep(self.p, self.batches, 98765, process_images=second)
+        self.assertEqual(seed, 1234)
+        self.assertEqual(len(second.batches), len(self.batches) - 2)
+        self.assertTrue(all(batch_p.seed == [1234] * len(batch_p.prompt) for batch_p in second.batches))
+        self.assertEqual(images + resumed_images, self.expected_prompts())
+        self.assertEqual(os.listdir(self.stylez.sweep_progress_dir), [])
+
+    def test_no_resume_starts_over_with_new_seed(self):
+        self.stylez.run_sweep(self.p, self.batches, 1234, process_images=RecordingProcessImages(self.stylez, interrupt_after=1))
+        self.stylez.shared.state.interrupted = False
+        process_images = RecordingProcessImages(self.stylez)
+        _, _, _, seed = self.stylez.run_sweep(self.p, self.batches, 98765, process_images=process_images, resume=False)
+        self.assertEqual(seed, 98765)
+        self.assertEqual(len(process_images.batches), len(self.batches))
+
+
+if __name__ == "__main__":
+    unittest.main()